@@ -3,17 +3,19 @@
 #
 
 import os
-import pickle
-from copy import deepcopy
+from collections import OrderedDict
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 from sunpy.time import parse_time
 from scipy.stats import spearmanr
 
 import hvorg_style as hvos
-plt.rc('text', usetex=True)
-plt.rc('font', size=14)
+import hvorg_tex as hvotex
+import hvorg_derived as hvod
+import hvorg_render as hvrender
+import hvorg_rollup as hvroll
+import hvorg_trace as hvtrace
+hvotex.setup(size=14)
 figsize = (10, 5)
 
 # Event annotation style
@@ -28,72 +30,52 @@ if application == 'helioviewer.org':
 if application == 'JHelioviewer':
     application_short = 'jhv'
 
-# services
-services = ["helioviewer.org movie", "helioviewer.org embed", "JHelioviewer movie"]
+# The services compared, the name of each in the rollup cube and the symbol
+# for its daily usage.  Any service in the rollup cube can be added.
+services = OrderedDict([("helioviewer.org movie", {"rollup": "hvorg_movie", "quantity": "hvm"}),
+                        ("helioviewer.org embed", {"rollup": "hvorg_embed", "quantity": "hve"}),
+                        ("JHelioviewer movie", {"rollup": "jhv_movie_timestamps_only", "quantity": "jhvm"})])
+# services["helioviewer.org screenshot"] = {"rollup": "hvorg_screenshot", "quantity": "hvs"}
 
-filenames = {"helioviewer.org movie": "hvorg_movie_request_time.pkl",
-             "helioviewer.org embed": "hvorg_embed_request_timestamps_only.pkl",
-             "JHelioviewer movie": "jhv_movie_request_timestamps_only.pkl"}
+# Compare the services over the days on which all of them have requests, or
+# over the days on which any of them has
+window = 'common'
+# window = 'union'
 
 # Read in the data
-directory = os.path.expanduser('~/Data/hvanalysis/derived')
+directory = hvod.directory
 
 # Image output location
 img = os.path.join(os.path.expanduser(hvos.img), application)
 
-# Service request times
-service_request_time = dict()
-for service in services:
-    f = os.path.join(directory, filenames[service])
-    service_request_time[service] = sorted(pickle.load(open(f, 'rb')))
-
-# Find the start and end times within which all services exist
-start_time = parse_time('1976-01-02')
-end_time = parse_time('2976-01-02')
-for service in services:
-    if service_request_time[service][0] > start_time:
-        start_time = service_request_time[service][0]
-    if service_request_time[service][-1] < end_time:
-        end_time = service_request_time[service][-1]
+# Daily service requests, read from the rollup cube as one matrix of days by
+# services
+with hvtrace.stage('binning'):
+    dfz = hvroll.count_matrix([services[service]["rollup"] for service in services], 'D', window=window,
+                              names=list(services.keys()), directory=directory)
+start_time = dfz.index[0]
+end_time = dfz.index[-1]
 
 # Figure 7
-# Daily numbers as a plot
-for i, service in enumerate(services):
-    these_times = service_request_time[service]
-    df = pd.DataFrame(these_times, columns=['date'])
-
-    # Setting the date as the index since the TimeGrouper works on Index, the date column is not dropped to be able to
-    # count
-    df.set_index('date', drop=False, inplace=True)
-
-    h = df[(df.index >= start_time) & (df.index <= end_time)].groupby(pd.TimeGrouper(freq='D')).count()
-    h.rename(columns={'date': service}, inplace=True)
-
-    if i == 0:
-        dfz = deepcopy(h)
-    else:
-        dfz[service] = pd.Series(h[service].values, index=dfz.index)
-
-total_daily_service_requests = dfz.sum(axis=1)
+figure = hvtrace.begin('figure 7')
+# Daily numbers as a plot, each service as a fraction of the total daily
+# usage.  Days with no requests at all have no fractions.
+daily = dfz.values
+total_daily_service_requests = daily.sum(axis=1)
+fractions = np.divide(daily, total_daily_service_requests[:, np.newaxis],
+                      out=np.zeros(daily.shape), where=total_daily_service_requests[:, np.newaxis] > 0)
+x = dfz.index.to_pydatetime()
 
-s0 = np.zeros(len(total_daily_service_requests))
-s1 = dfz["helioviewer.org movie"].values / total_daily_service_requests.values
-s2 = (dfz["helioviewer.org movie"].values + dfz["helioviewer.org embed"].values) / total_daily_service_requests.values
-s3 = np.ones(len(total_daily_service_requests))
-x = total_daily_service_requests.index.to_pydatetime()
-
-f_denominator = '{{{:s}}}+{{{:s}}}+{{{:s}}}'.format(hvos.quantity["hvm"], hvos.quantity["hve"], hvos.quantity["jhvm"])
-f_hvm = '{{{:s}}}/({{{:s}}})'.format(hvos.quantity["hvm"], f_denominator)
-f_jhvm = '{{{:s}}}/({{{:s}}})'.format(hvos.quantity["jhvm"], f_denominator)
-f_hve = '{{{:s}}}/({{{:s}}})'.format(hvos.quantity["hve"], f_denominator)
+symbols = [hvos.quantity[services[service]["quantity"]] for service in services]
+f_denominator = '+'.join('{{{:s}}}'.format(symbol) for symbol in symbols)
+labels = ['{:s} requests\n{{{:s}}}/({{{:s}}})'.format(service, symbol, f_denominator)
+          for service, symbol in zip(services, symbols)]
 
 
 plt.close('all')
 fig = plt.figure(figsize=(10, 5))
 ax = fig.add_subplot(111)
-ax.fill_between(x, s0, s1, label='helioviewer.org movie requests\n{{{:s}}}'.format(f_hvm))
-ax.fill_between(x, s1, s2, label='helioviewer.org embed requests\n{{{:s}}}'.format(f_hve))
-ax.fill_between(x, s2, s3, label='JHelioviewer movie requests\n{{{:s}}}'.format(f_jhvm))
+ax.stackplot(x, fractions.T, labels=labels)
 ax.set_title("service usage expressed as fraction of total daily usage")
 ax.set_ylabel("fractional use")
 subtitle = '{{{:s}}} - {{{:s}}}'.format(str(start_time.date()), str(end_time.date()))
@@ -145,12 +127,14 @@ plt.tight_layout()
 filename = hvos.overleaf(os.path.join('fractional_service_usage'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
 filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+hvotex.savefig(filepath)
+figure.end()
 
 
-# Cross correlation - movies
-plt.close('all')
+# The figures drawn at the same time
+figures = []
 
+# Cross correlation - movies
 down_time = '2015-07-01'
 
 dfz_before_down_time = dfz[(dfz.index < down_time)]
@@ -162,8 +146,6 @@ ge1 = np.logical_and(xb >= 1, yb >= 1)
 polyfit_xb = np.log10(xb[ge1])
 polyfit_yb = np.log10(yb[ge1])
 polyfit = np.polyfit(polyfit_xb, polyfit_yb, 1)
-xbp = np.arange(0, 4.0, 0.001)
-ybp = 10.0**np.polyval(polyfit, xbp)
 fit_string = '{{{:s}}}$=$ {{{:.2f}}} {{{:s}}}$^{{{:.2f}}}$'.format(hvos.quantity["jhvm"], 10.0**polyfit[1], hvos.quantity["hvm"], polyfit[0])
 
 cc = spearmanr(polyfit_xb, polyfit_yb)
@@ -175,68 +157,49 @@ dfz_after_down_time = dfz[(dfz.index >= down_time)]
 xa = dfz_after_down_time["helioviewer.org movie"].values
 ya = dfz_after_down_time["JHelioviewer movie"].values
 
-scatter_size = 1.5
-after_scatter_color = 'm'
-after_scatter_marker = 's'
-
-label = 'before {{{:s}}} '.format(down_time) + hvos.tlabel(len(xb), suffix='days')
-plt.scatter(xb, yb, s=scatter_size, label=label)
-label = 'after {{{:s}}} '.format(down_time) + hvos.tlabel(len(xa), suffix='days')
-plt.scatter(xa, ya, s=scatter_size, color=after_scatter_color,  marker=after_scatter_marker, label=label)
-plt.plot(10**xbp, ybp, color='k', label='best fit (before {{{:s}}})\n{{{:s}}}\n{{{:s}}}'.format(down_time, spearman_string, fit_string))
-plt.plot([1, 10000], [1, 10000], linestyle=':', color='k', label='equality')
-plt.yscale('log')
-plt.xscale('log')
-plt.xlim(1, 10000)
-plt.ylim(1, 10000)
-xlabel = 'helioviewer.org movies, daily usage ({{{:s}}})'.format(hvos.quantity["hvm"])
-plt.xlabel(xlabel)
-ylabel = 'JHelioviewer movies, daily usage ({{{:s}}})'.format(hvos.quantity["jhvm"])
-plt.ylabel(ylabel)
-title = 'service usage correlation\n{{{:s}}}\nhelioviewer.org movies vs JHelioviewer movies'.format(subtitle)
-plt.title(title)
-plt.grid('on', linestyle='dotted')
-plt.legend(framealpha=0.3, fontsize=10, facecolor='y')
-plt.tight_layout()
 filename = hvos.overleaf(os.path.join('scatter_hvorg_movies_vs_jhv_movies'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.usage_scatter, os.path.join(img, filename),
+                               data={'xb': xb, 'yb': yb, 'xa': xa, 'ya': ya, 'fit': polyfit},
+                               before_label='before {{{:s}}} '.format(down_time) + hvos.tlabel(len(xb), suffix='days'),
+                               after_label='after {{{:s}}} '.format(down_time) + hvos.tlabel(len(xa), suffix='days'),
+                               fit_label='best fit (before {{{:s}}})\n{{{:s}}}\n{{{:s}}}'.format(down_time, spearman_string, fit_string),
+                               equality=True,
+                               xlabel='helioviewer.org movies, daily usage ({{{:s}}})'.format(hvos.quantity["hvm"]),
+                               ylabel='JHelioviewer movies, daily usage ({{{:s}}})'.format(hvos.quantity["jhvm"]),
+                               title='service usage correlation\n{{{:s}}}\nhelioviewer.org movies vs JHelioviewer movies'.format(subtitle)))
 
 
 # Cross correlation - movies
-plt.close('all')
-
-down_time = '2015-07-01'
-
 dfz_before_down_time = dfz[(dfz.index < down_time)]
 xb = dfz_before_down_time["helioviewer.org movie"].values
 yb = dfz_before_down_time["helioviewer.org embed"].values
 
-label = 'before {{{:s}}} '.format(down_time) + hvos.tlabel(len(xb), suffix='days')
-plt.scatter(xb, yb, s=scatter_size, label=label)
-
 dfz_after_down_time = dfz[(dfz.index >= down_time)]
 xa = dfz_after_down_time["helioviewer.org movie"].values
 ya = dfz_after_down_time["helioviewer.org embed"].values
-label = 'after {{{:s}}} '.format(down_time) + hvos.tlabel(len(xa), suffix='days')
-plt.scatter(xa, ya, s=scatter_size, color=after_scatter_color, marker=after_scatter_marker, label=label)
-
-
-plt.yscale('log')
-plt.xscale('log')
-plt.xlim(1, 10000)
-plt.ylim(1, 10000)
-xlabel = 'helioviewer.org movies, daily usage ({{{:s}}})'.format(hvos.quantity["hvm"])
-plt.xlabel(xlabel)
-ylabel = 'helioviewer embeds, daily usage ({{{:s}}})'.format(hvos.quantity["hve"])
-plt.ylabel(ylabel)
-title = 'service usage correlation\n{{{:s}}}\nhelioviewer.org movies vs helioviewer.org embeds'.format(subtitle)
-plt.title(title)
-plt.grid('on', linestyle='dotted')
-plt.legend(framealpha=0.3, facecolor='y', fontsize=10)
-plt.tight_layout()
+
 filename = hvos.overleaf(os.path.join('scatter_hvorg_movies_vs_hvorg_embeds'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.usage_scatter, os.path.join(img, filename),
+                               data={'xb': xb, 'yb': yb, 'xa': xa, 'ya': ya},
+                               before_label='before {{{:s}}} '.format(down_time) + hvos.tlabel(len(xb), suffix='days'),
+                               after_label='after {{{:s}}} '.format(down_time) + hvos.tlabel(len(xa), suffix='days'),
+                               xlabel='helioviewer.org movies, daily usage ({{{:s}}})'.format(hvos.quantity["hvm"]),
+                               ylabel='helioviewer embeds, daily usage ({{{:s}}})'.format(hvos.quantity["hve"]),
+                               title='service usage correlation\n{{{:s}}}\nhelioviewer.org movies vs helioviewer.org embeds'.format(subtitle)))
+
+
+# Correlation of the daily usage of every service with every other service
+rho = dfz.corr(method='spearman')
+filename = hvos.overleaf(os.path.join('correlation_all_services'))
+filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
+figures.append(hvrender.figure(hvrender.correlation_matrix, os.path.join(img, filename), figsize=(7, 6),
+                               data={'rho': rho.values},
+                               ticklabels=symbols,
+                               clabel='Spearman $\\rho$',
+                               title='service usage correlation\n{{{:s}}}\ndaily usage of all services'.format(subtitle)))
+
+# Draw the figures above at the same time.  Figures that have not changed
+# since they were last drawn are skipped.
+hvrender.render(figures, group='analyze_timestamps')
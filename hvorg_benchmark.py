@@ -0,0 +1,222 @@
+#
+# Benchmark of the prepare and analysis stages.  Synthetic logs are written at
+# each of the sizes asked for, and each stage is run on them: reading the
+# logs, parsing the times, the movie metrics, the data source incidence
+# matrix, counting the requests in time bins, and drawing the figures.  The
+# wall time, CPU time, peak memory and number of rows of each stage are
+# written to a JSON file, so that runs of different versions of the code can
+# be compared with compare().
+#
+import os
+import json
+import time
+import platform
+import tracemalloc
+import subprocess
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+import hvorg_time as hvot
+import hvorg_sources as hvsrc
+import hvorg_catalog as hvcat
+import hvorg_stream as hvstream
+import hvorg_metrics as hvom
+import hvorg_counts as hvcount
+import hvorg_derived as hvod
+import hvorg_logs as hvlog
+import hvorg_tex as hvotex
+import hvorg_render as hvrender
+import hvorg_synthetic as hvsyn
+import hvorg_trace as hvtrace
+
+# Where the synthetic logs and the results are written
+benchmark_directory = os.path.join(hvod.directory, 'benchmark')
+
+# Number of rows of the movie, screenshot and embed logs.  The JHelioviewer
+# log has a tenth as many rows.
+sizes = (1000000,)
+# sizes = (1000000, 10000000)
+# sizes = (1000000, 10000000, 100000000)
+
+# Number of worker processes used to parse the times
+workers = hvstream.workers
+
+# Measure the peak memory allocated by each stage.  This slows down the
+# stages that allocate many small Python objects.
+trace_memory = True
+# trace_memory = False
+
+# How each log is parsed, and whether it records data sources
+logs = OrderedDict([('movies', {'derive': hvot.movie_times, 'sources': True}),
+                    ('screenshots', {'derive': hvot.screenshot_times, 'sources': True}),
+                    ('embed', {'derive': hvot.request_times, 'sources': False}),
+                    ('jpx', {'derive': hvot.movie_times, 'sources': True}),
+                    ('jhv_request_statistics', {'derive': hvot.request_times, 'sources': False})])
+
+
+# Run one stage.  'stage' returns its result and the number of rows it
+# handled.  Returns the result and a record of the measurements.  The peak
+# resident memory is that of this process during the stage alone, where the
+# system allows its high water mark to be reset, and does not include worker
+# processes.
+def measure(name, stage, *args, **kwargs):
+    if trace_memory:
+        tracemalloc.start()
+    hvtrace.reset_high_water_mark()
+    cpu = hvtrace.cpu_time()
+    wall = time.perf_counter()
+    result, rows = stage(*args, **kwargs)
+    record = OrderedDict([('stage', name),
+                          ('rows', int(rows)),
+                          ('wall_seconds', time.perf_counter() - wall),
+                          ('cpu_seconds', hvtrace.cpu_time() - cpu)])
+    if trace_memory:
+        record['peak_allocated_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    record['peak_rss_bytes'] = hvtrace.high_water_mark()
+    print('{:s}: {:d} rows, {:.2f} s'.format(name, record['rows'], record['wall_seconds']))
+    return result, record
+
+
+# The stages
+
+# Read the files of a log, the current log and then the legacy log if there
+# is one, as the prepare scripts do
+def read(paths):
+    df = hvlog.read(paths)
+    return df, len(df)
+
+
+def parse(derive, df):
+    times = hvstream.derive_frame(derive, df, workers=workers)
+    return times, len(df)
+
+
+def incidence(values, catalog):
+    m, sources = hvsrc.incidence_matrix(values, sources=list(catalog.ids))
+    return m, len(values)
+
+
+def metrics(times):
+    m = hvom.movie_metrics(times['request_time'], times['start_time'], times['end_time'],
+                           durations=times['durations_seconds'])
+    return m, len(times['request_time'])
+
+
+def binning(request_time):
+    counts = [hvcount.time_counts(request_time, freq) for freq in hvcount.freqs]
+    return counts, len(request_time)
+
+
+def histograms(m):
+    index = hvcount.SortedIndex(m['topicality'])
+    counts = [index.histogram(100), index.histogram(30 * 24, low=0, high=30 * 86400)]
+    density = hvcount.log_histogram2d(m['durations'], m['topicality'])
+    return (counts, density), len(index)
+
+
+# Draw a histogram and a density figure in draft mode, without the render
+# cache
+def render(m, directory):
+    hvotex.setup(draft=True)
+    cache = hvrender.cache
+    hvrender.cache = False
+    try:
+        counts, edges = hvcount.SortedIndex(m['topicality']).histogram(100)
+        density, xedges, yedges = hvcount.log_histogram2d(m['durations'], m['topicality'])
+        figures = [hvrender.figure(hvrender.histogram, os.path.join(directory, 'topicality.png'),
+                                   data={'counts': counts, 'edges': edges},
+                                   xlabel='topicality', ylabel='movies', title='topicality'),
+                   hvrender.figure(hvrender.density, os.path.join(directory, 'duration_vs_topicality.png'),
+                                   data={'counts': density, 'xedges': xedges, 'yedges': yedges},
+                                   equality=(xedges[0], xedges[-1]),
+                                   xlabel='duration', ylabel='topicality', title='duration vs topicality')]
+        hvrender.render(figures, manifest_path=os.path.join(directory, 'manifest.json'))
+    finally:
+        hvrender.cache = cache
+    return figures, len(m['topicality'])
+
+
+# The version of the code, if it is in git
+def code_version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Benchmark all the stages on logs with n rows.  The logs are written unless
+# they are already there.  Returns the results.
+def run(n, directory=benchmark_directory, seed=hvsyn.seed):
+    data_directory = os.path.join(directory, 'data_{:d}'.format(n))
+    rows = dict((log, n) for log in hvsyn.logs)
+    rows['jpx'] = n // 10
+    rows['jhv_request_statistics'] = n // 10
+    paths = OrderedDict((log, [os.path.join(data_directory, hvsyn.logs[log][f]) for f in ('file', 'legacy')
+                               if hvsyn.logs[log][f] is not None])
+                        for log in hvsyn.logs)
+    paths['getDataSources'] = os.path.join(data_directory, 'getDataSources.json')
+    stages = []
+    files = [paths['getDataSources']] + [f for log in hvsyn.logs for f in paths[log]]
+    if not all(os.path.exists(f) for f in files):
+        paths, record = measure('generate', lambda: (hvsyn.write_all(data_directory, rows=rows, seed=seed),
+                                                     sum(rows.values())))
+        stages.append(record)
+
+    catalog = hvcat.build(paths['getDataSources'])
+    for log in logs:
+        df, record = measure('{:s}.read'.format(log), read, paths[log])
+        stages.append(record)
+        times, record = measure('{:s}.parse'.format(log), parse, logs[log]['derive'], df)
+        stages.append(record)
+        if logs[log]['sources']:
+            m, record = measure('{:s}.incidence'.format(log), incidence, df.column('DataSourceID'), catalog)
+            stages.append(record)
+        del df
+        result, record = measure('{:s}.binning'.format(log), binning, times['request_time'])
+        stages.append(record)
+        if log == 'movies':
+            m, record = measure('{:s}.metrics'.format(log), metrics, times)
+            stages.append(record)
+            result, record = measure('{:s}.histograms'.format(log), histograms, m)
+            stages.append(record)
+            result, record = measure('{:s}.render'.format(log), render, m, data_directory)
+            stages.append(record)
+
+    return OrderedDict([('rows', n),
+                        ('version', code_version()),
+                        ('time', pd.Timestamp.now().isoformat()),
+                        ('python', platform.python_version()),
+                        ('numpy', np.__version__),
+                        ('pandas', pd.__version__),
+                        ('workers', workers),
+                        ('stages', stages)])
+
+
+# Write the results of a benchmark.  Returns the file written.
+def save(results, directory=benchmark_directory):
+    os.makedirs(directory, exist_ok=True)
+    version = results['version'][:10] if results['version'] is not None else 'unknown'
+    f = os.path.join(directory, 'benchmark_{:d}_{:s}_{:s}.json'.format(results['rows'], version,
+                                                                      pd.Timestamp(results['time']).strftime('%Y%m%dT%H%M%S')))
+    json.dump(results, open(f, 'w'), indent=1)
+    return f
+
+
+# Compare the wall time and peak memory of each stage in two benchmark result
+# files.  Returns a DataFrame of the ratios new / old.
+def compare(old, new):
+    frames = []
+    for f in (old, new):
+        frames.append(pd.DataFrame(json.load(open(f, 'r'))['stages']).set_index('stage'))
+    columns = [c for c in ('wall_seconds', 'cpu_seconds', 'peak_allocated_bytes', 'peak_rss_bytes')
+               if c in frames[0] and c in frames[1]]
+    return frames[1][columns] / frames[0][columns]
+
+
+if __name__ == '__main__':
+    for n in sizes:
+        print('Benchmarking {:d} rows'.format(n))
+        print('Saved ' + save(run(n)))
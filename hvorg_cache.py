@@ -0,0 +1,215 @@
+#
+# Content-addressed cache of the derived data.  Each prepare step is keyed by
+# a hash of its input files, its parameters and the code that runs it.  When
+# the outputs for a key are already in the cache they are put back in place
+# and the step is not run at all.
+#
+# Each key has its own generation directory in the cache holding hard links
+# to the outputs and a manifest.  The least recently used generations are
+# evicted once the cache grows beyond max_size.
+#
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import fnmatch
+import runpy
+
+import hvorg_derived as hvod
+
+# Where the cache lives
+cache_directory = os.path.join(hvod.directory, 'cache')
+
+# Largest size of the cache in bytes
+max_size = 20 * 1024**3
+
+# Where the code lives
+code_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+# SHA-1 of a file.  Hashes are remembered in 'memo' by path, size and
+# modification time so that unchanged inputs are not read again.
+def file_hash(path, memo=None):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    if memo is not None:
+        known = memo.get(path)
+        if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['sha1']
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            h.update(block)
+    if memo is not None:
+        memo[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': h.hexdigest()}
+    return h.hexdigest()
+
+
+def load_memo(directory=cache_directory):
+    f = os.path.join(directory, 'hashes.json')
+    return json.load(open(f, 'r')) if os.path.exists(f) else {}
+
+
+# The memo is replaced in one go so that steps running at the same time never
+# see a half written file
+def save_memo(memo, directory=cache_directory):
+    f = os.path.join(directory, 'hashes.json')
+    json.dump(memo, open('{:s}.{:d}'.format(f, os.getpid()), 'w'))
+    os.rename('{:s}.{:d}'.format(f, os.getpid()), f)
+
+
+# The script and all the hvorg_ modules it uses, directly or indirectly
+def code_files(script):
+    found = []
+    todo = [os.path.abspath(script)]
+    while todo:
+        f = todo.pop()
+        if f in found:
+            continue
+        found.append(f)
+        for module in re.findall(r'^\s*import (hvorg_\w+)', open(f, 'r').read(), re.MULTILINE):
+            g = os.path.join(code_directory, '{:s}.py'.format(module))
+            if os.path.exists(g):
+                todo.append(g)
+    return sorted(found)
+
+
+# The key of a step: a hash of its inputs, parameters and code
+def step_key(script, inputs, parameters=None, memo=None):
+    h = hashlib.sha1()
+    for f in inputs:
+        h.update('input {:s} {:s}\n'.format(os.path.basename(f), file_hash(f, memo=memo)).encode('utf-8'))
+    h.update('parameters {:s}\n'.format(json.dumps(parameters, sort_keys=True)).encode('utf-8'))
+    for f in code_files(script):
+        h.update('code {:s} {:s}\n'.format(os.path.basename(f), file_hash(f)).encode('utf-8'))
+    return h.hexdigest()
+
+
+# Does a file name match any of the patterns?  No patterns matches everything.
+def matches(name, patterns=None):
+    return patterns is None or any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+# Size and modification time of every file in a directory whose name matches
+# the patterns
+def snapshot(directory, patterns=None):
+    s = {}
+    for name in os.listdir(directory):
+        f = os.path.join(directory, name)
+        if os.path.isfile(f) and matches(name, patterns):
+            stat = os.stat(f)
+            s[name] = (stat.st_size, stat.st_mtime_ns)
+    return s
+
+
+# Files that are also in the cache are replaced by copies, so that a step
+# writing to them cannot change what is in the cache
+def unshare(directory, patterns=None):
+    for name in os.listdir(directory):
+        f = os.path.join(directory, name)
+        if os.path.isfile(f) and matches(name, patterns) and os.stat(f).st_nlink > 1:
+            shutil.copy2(f, f + '.tmp')
+            os.rename(f + '.tmp', f)
+
+
+# Hard link a file, copying it if that is not possible
+def link(source, destination):
+    if os.path.exists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def load_manifest(generation):
+    return json.load(open(os.path.join(generation, 'manifest.json'), 'r'))
+
+
+def save_manifest(generation, manifest):
+    json.dump(manifest, open(os.path.join(generation, 'manifest.json'), 'w'), indent=1)
+
+
+# Remove the least recently used generations until the cache is no larger than
+# max_size.  Generations listed in 'keep' are never removed.
+def evict(directory=cache_directory, max_size=max_size, keep=()):
+    generations = []
+    for step in os.listdir(directory):
+        step_directory = os.path.join(directory, step)
+        if not os.path.isdir(step_directory):
+            continue
+        for key in os.listdir(step_directory):
+            generation = os.path.join(step_directory, key)
+            if not os.path.exists(os.path.join(generation, 'manifest.json')):
+                continue
+            manifest = load_manifest(generation)
+            generations.append((manifest['used'], manifest['size'], generation))
+
+    total = sum(g[1] for g in generations)
+    for used, size, generation in sorted(generations):
+        if total <= max_size:
+            break
+        if generation in keep:
+            continue
+        print('Evicting ' + generation)
+        shutil.rmtree(generation)
+        total -= size
+
+
+# Run a prepare script unless the cache already holds its outputs for the
+# same inputs, parameters and code.  The parameters are passed to the script
+# as global variables it starts with.  The outputs are the files in
+# save_directory that the script creates or changes and whose names match the
+# 'outputs' patterns, so that steps running at the same time in the same
+# directory keep their outputs apart.  Files matching the 'watermarks'
+# patterns describe the outputs they were written with, so when cached outputs
+# are put back any such file that is not one of them is removed, as the script
+# would have done.  The cache is only trimmed if max_size is not None.
+# Returns True if the script was run, False if the cached outputs were used.
+def run_step(name, script, inputs, parameters=None, outputs=None, watermarks=None, save_directory=hvod.directory,
+             directory=cache_directory, max_size=max_size):
+    os.makedirs(directory, exist_ok=True)
+    memo = load_memo(directory)
+    key = step_key(script, inputs, parameters=parameters, memo=memo)
+    save_memo(memo, directory)
+    generation = os.path.join(directory, name, key)
+
+    if os.path.exists(os.path.join(generation, 'manifest.json')):
+        print('{:s}: using cached outputs {:s}'.format(name, key))
+        manifest = load_manifest(generation)
+        for output in manifest['outputs']:
+            link(os.path.join(generation, output), os.path.join(save_directory, output))
+        if watermarks is not None:
+            for stale in snapshot(save_directory, patterns=watermarks):
+                if stale not in manifest['outputs']:
+                    os.remove(os.path.join(save_directory, stale))
+        manifest['used'] = time.time()
+        save_manifest(generation, manifest)
+        return False
+
+    print('{:s}: running {:s}'.format(name, script))
+    unshare(save_directory, patterns=outputs)
+    before = snapshot(save_directory, patterns=outputs)
+    runpy.run_path(script, init_globals=parameters, run_name='__main__')
+    after = snapshot(save_directory, patterns=outputs)
+    changed = sorted(output for output in after if before.get(output) != after[output])
+
+    os.makedirs(generation, exist_ok=True)
+    for output in changed:
+        link(os.path.join(save_directory, output), os.path.join(generation, output))
+    save_manifest(generation, {'step': name,
+                               'key': key,
+                               'script': os.path.basename(script),
+                               'inputs': [os.path.basename(f) for f in inputs],
+                               'parameters': parameters,
+                               'outputs': changed,
+                               'size': sum(after[output][0] for output in changed),
+                               'created': time.time(),
+                               'used': time.time()})
+    if max_size is not None:
+        evict(directory=directory, max_size=max_size, keep=(generation,))
+    return True
@@ -0,0 +1,117 @@
+#
+# Catalog of the Helioviewer data sources, built from the getDataSources.json
+# returned by the Helioviewer API.  Each data source has an id, a nickname and
+# a place in the hierarchy of observatory, instrument, detector and
+# measurement.  The catalog is built once and kept on disk next to the derived
+# data, and is only rebuilt when getDataSources.json changes.
+#
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import hvorg_derived as hvod
+
+# Where the data sources file lives
+source_directory = os.path.expanduser('~/Data/hvanalysis/source')
+get_sources_ids = 'getDataSources.json'
+
+# Where the catalog is kept
+catalog_file = os.path.join(hvod.directory, 'data_source_catalog.json')
+
+# The names of the levels of the data source hierarchy
+levels = ('observatory', 'instrument', 'detector', 'measurement')
+
+
+# Walk the getDataSources.json hierarchy.  Yields the id, nickname and the
+# keys leading to each data source.
+def walk(d, path=()):
+    for k, v in d.items():
+        if k == 'sourceId':
+            yield str(d['sourceId']), d['nickname'], path
+        elif isinstance(v, dict):
+            for entry in walk(v, path + (k,)):
+                yield entry
+
+
+class Catalog(object):
+    # 'entries' is a list of (id, nickname, path) in getDataSources.json order
+    def __init__(self, entries):
+        self.entries = [(str(sid), nickname, tuple(path)) for sid, nickname, path in entries]
+        self.ids = [entry[0] for entry in self.entries]
+        self._nickname = dict((sid, nickname) for sid, nickname, path in self.entries)
+        self._id = dict((nickname, sid) for sid, nickname, path in self.entries)
+        self._path = dict((sid, path) for sid, nickname, path in self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, source_id):
+        return str(source_id) in self._nickname
+
+    # The nickname of a data source.  Unknown ids are returned as they are.
+    def nickname(self, source_id):
+        return self._nickname.get(str(source_id), str(source_id))
+
+    # The id of the data source with this nickname
+    def source_id(self, nickname):
+        return self._id[nickname]
+
+    # The keys leading to a data source in the hierarchy
+    def path(self, source_id):
+        return self._path[str(source_id)]
+
+    # The name of one level of the hierarchy for a data source, such as its
+    # 'instrument'.  None if the data source is unknown or the hierarchy is not
+    # that deep.
+    def level(self, source_id, level):
+        path = self._path.get(str(source_id), ())
+        i = levels.index(level)
+        return path[i] if i < len(path) else None
+
+    # The nicknames of a list of data sources
+    def nicknames(self, sources):
+        return [self.nickname(source) for source in sources]
+
+    # The (id, nickname) pairs the prepare scripts have always saved
+    def source_ids_and_nicknames(self):
+        return [(sid, nickname) for sid, nickname, path in self.entries]
+
+    # Sum the columns of a data source incidence matrix over one level of the
+    # hierarchy.  Returns the grouped matrix and the name of each group.
+    # Unknown data sources form their own group.
+    def group_incidence(self, m, sources, level='instrument'):
+        groups = ['/'.join(self.path(s)[:levels.index(level) + 1]) if s in self else str(s) for s in sources]
+        codes, names = pd.factorize(np.asarray(groups, dtype=object))
+        g = sparse.csr_matrix((np.ones(len(codes), dtype=np.int32), (np.arange(len(codes)), codes)),
+                              shape=(len(codes), len(names)))
+        return m.dot(g), [str(name) for name in names]
+
+    def to_json(self):
+        return [[sid, nickname, list(path)] for sid, nickname, path in self.entries]
+
+
+# Build the catalog from getDataSources.json
+def build(path=os.path.join(source_directory, get_sources_ids)):
+    return Catalog(walk(json.load(open(path, 'r'))))
+
+
+# The catalog for a getDataSources.json file.  The catalog is read from
+# catalog_file if it was built from the same file, and built and saved
+# otherwise.
+def load(path=os.path.join(source_directory, get_sources_ids), catalog_file=catalog_file):
+    stat = os.stat(path)
+    source = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    if os.path.exists(catalog_file):
+        saved = json.load(open(catalog_file, 'r'))
+        if saved['source'] == source:
+            return Catalog(saved['entries'])
+
+    catalog = build(path)
+    # Written in one go so that steps running at the same time never see a
+    # half written file
+    tmp = '{:s}.{:d}'.format(catalog_file, os.getpid())
+    json.dump({'source': source, 'entries': catalog.to_json()}, open(tmp, 'w'), indent=1)
+    os.rename(tmp, catalog_file)
+    return catalog
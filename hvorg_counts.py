@@ -0,0 +1,182 @@
+#
+# Fast counting of the derived data.  A SortedIndex is built once for a
+# quantity such as the topicality, after which the number of values in any
+# range, and histograms with any bins, are found by binary search without
+# filtering the full array again.
+#
+# Pairs of values are counted in two dimensional bins equally spaced in the
+# logarithm of each value, so that millions of points can be drawn as one
+# density image.
+#
+# Timestamps are counted in minute, hour, day, week, month and quarter bins by
+# turning each time into the integer number of its bin and counting with
+# np.bincount.
+#
+import numpy as np
+import pandas as pd
+
+# Time bins that can be counted: minute, hour, day, week (Monday to Sunday),
+# month and quarter
+freqs = ('min', 'h', 'D', 'W', 'M', 'Q')
+
+
+class SortedIndex(object):
+    # Index the values of a one dimensional array.  NaNs are left out.
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.values = np.sort(values[~np.isnan(values)])
+
+    def __len__(self):
+        return len(self.values)
+
+    # The positions in the sorted values of the first value in the range and
+    # of the first value after it.  A bound of None is open.
+    def bounds(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        start = 0 if low is None else np.searchsorted(self.values, low, side='left' if low_inclusive else 'right')
+        stop = len(self) if high is None else np.searchsorted(self.values, high,
+                                                               side='right' if high_inclusive else 'left')
+        return int(start), int(max(start, stop))
+
+    # The number of values in a range
+    def count(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        start, stop = self.bounds(low, high, low_inclusive=low_inclusive, high_inclusive=high_inclusive)
+        return stop - start
+
+    # The values in a range, in order.  This is a view of the index, not a copy.
+    def select(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        start, stop = self.bounds(low, high, low_inclusive=low_inclusive, high_inclusive=high_inclusive)
+        return self.values[start:stop]
+
+    # A histogram of the values in a range, with the same meaning as
+    # np.histogram: 'bins' is either a number of equal bins spanning the
+    # smallest to the largest value in the range, or the bin edges.  All bins
+    # but the last are half open.  Returns the counts and the bin edges.
+    def histogram(self, bins, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        start, stop = self.bounds(low, high, low_inclusive=low_inclusive, high_inclusive=high_inclusive)
+        values = self.values[start:stop]
+        if np.ndim(bins) == 0:
+            if len(values) == 0:
+                first, last = 0.0, 1.0
+            else:
+                first, last = values[0], values[-1]
+            if first == last:
+                first, last = first - 0.5, last + 0.5
+            edges = np.linspace(first, last, int(bins) + 1)
+        else:
+            edges = np.asarray(bins, dtype=np.float64)
+        positions = np.searchsorted(values, edges, side='left')
+        positions[-1] = np.searchsorted(values, edges[-1], side='right')
+        return np.diff(positions), edges
+
+
+# Count pairs of values in bins equally spaced in log10(x) and log10(y).
+# 'bins' is the number of bins along each axis, or a pair of them.  Pairs
+# where either value is not positive and finite are left out.  The bins span
+# the smallest to the largest value, unless xrange or yrange give them.
+# Returns the counts, of shape (x bins, y bins), and the x and y bin edges.
+def log_histogram2d(x, y, bins=200, xrange=None, yrange=None):
+    nx, ny = (bins, bins) if np.ndim(bins) == 0 else bins
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = (x > 0) & (y > 0) & np.isfinite(x) & np.isfinite(y)
+    lx = np.log10(x[keep])
+    ly = np.log10(y[keep])
+
+    edges = []
+    numbers = []
+    for values, n, r in ((lx, nx, xrange), (ly, ny, yrange)):
+        if r is not None:
+            low, high = np.log10(r[0]), np.log10(r[1])
+        elif len(values) > 0:
+            low, high = values.min(), values.max()
+        else:
+            low, high = 0.0, 1.0
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        e = np.linspace(low, high, int(n) + 1)
+        # The last bin includes its upper edge, as in np.histogram
+        i = np.floor((values - low) * (int(n) / (high - low))).astype(np.int64)
+        i[values == high] = int(n) - 1
+        edges.append(10.0 ** e)
+        numbers.append(i)
+
+    inside = (numbers[0] >= 0) & (numbers[0] < nx) & (numbers[1] >= 0) & (numbers[1] < ny)
+    cells = numbers[0][inside] * int(ny) + numbers[1][inside]
+    counts = np.bincount(cells, minlength=int(nx) * int(ny)).reshape(int(nx), int(ny))
+    return counts, edges[0], edges[1]
+
+
+# The number of the bin of each time, counted from the epoch
+def bin_numbers(times, freq='D'):
+    t = np.asarray(times).astype('datetime64[ns]')
+    if freq == 'min':
+        return t.astype('datetime64[m]').astype(np.int64)
+    if freq == 'h':
+        return t.astype('datetime64[h]').astype(np.int64)
+    if freq == 'D':
+        return t.astype('datetime64[D]').astype(np.int64)
+    if freq == 'W':
+        # 1970-01-01 was a Thursday; weeks start on Monday
+        return (t.astype('datetime64[D]').astype(np.int64) + 3) // 7
+    if freq == 'M':
+        return t.astype('datetime64[M]').astype(np.int64)
+    if freq == 'Q':
+        return t.astype('datetime64[M]').astype(np.int64) // 3
+    raise ValueError('Unknown time bin: {:s}'.format(str(freq)))
+
+
+# The times labelling bins, the same as pandas uses: the start of the minute,
+# hour or day, or the last day of the week, month or quarter
+def bin_labels(numbers, freq='D'):
+    numbers = np.asarray(numbers, dtype=np.int64)
+    if freq == 'min':
+        return numbers.astype('datetime64[m]')
+    if freq == 'h':
+        return numbers.astype('datetime64[h]')
+    if freq == 'D':
+        return numbers.astype('datetime64[D]')
+    if freq == 'W':
+        return (7 * numbers + 3).astype('datetime64[D]')
+    if freq == 'M':
+        return (numbers + 1).astype('datetime64[M]').astype('datetime64[D]') - np.timedelta64(1, 'D')
+    if freq == 'Q':
+        return (3 * numbers + 3).astype('datetime64[M]').astype('datetime64[D]') - np.timedelta64(1, 'D')
+    raise ValueError('Unknown time bin: {:s}'.format(str(freq)))
+
+
+# Count how many times fall in each minute, hour, day, week, month or quarter.  Only the
+# times from start to end, inclusive, are counted, and if given, start and end
+# also fix the first and last bins.  Otherwise the bins run from the first to
+# the last time.  NaT is ignored.  Returns a Series of counts indexed by the
+# date labelling each bin.
+def time_counts(times, freq='D', start=None, end=None, name=None):
+    t = np.asarray(times).astype('datetime64[ns]')
+    keep = ~np.isnat(t)
+    if start is not None:
+        start = np.datetime64(pd.Timestamp(start), 'ns')
+        keep &= t >= start
+    if end is not None:
+        end = np.datetime64(pd.Timestamp(end), 'ns')
+        keep &= t <= end
+    numbers = bin_numbers(t if np.all(keep) else t[keep], freq)
+
+    if start is not None:
+        first = int(bin_numbers([start], freq)[0])
+    elif len(numbers) > 0:
+        first = int(numbers.min())
+    if end is not None:
+        last = int(bin_numbers([end], freq)[0])
+    elif len(numbers) > 0:
+        last = int(numbers.max())
+    if len(numbers) == 0 and (start is None or end is None):
+        return pd.Series(np.zeros(0, dtype=np.int64), index=pd.DatetimeIndex([], name='date'), name=name)
+
+    nbins = last - first + 1
+    counts = np.bincount(numbers - first, minlength=nbins)[:nbins]
+    return counts_series(counts, first, freq, name=name)
+
+
+# A Series of counts in consecutive bins, the first of which is numbered first
+def counts_series(counts, first, freq='D', name=None):
+    labels = bin_labels(np.arange(first, first + len(counts)), freq).astype('datetime64[ns]')
+    return pd.Series(counts, index=pd.DatetimeIndex(labels, name='date'), name=name)
@@ -0,0 +1,59 @@
+#
+# Reading and writing the derived data.  Each derived quantity is a typed,
+# one dimensional .npy file: times are datetime64[ns] (int64 nanoseconds since
+# the epoch) and durations are float64 seconds.  Files written by earlier
+# versions of the prepare scripts - pickled lists of datetimes and object
+# arrays of datetimes - can still be read.
+#
+import os
+import pickle
+import datetime
+import numpy as np
+import pandas as pd
+
+# Where the derived data lives
+directory = os.path.expanduser('~/Data/hvanalysis/derived')
+
+
+# Convert a sequence of datetime objects to datetime64[ns].  Anything that is
+# not a datetime, such as the -1 that used to mark invalid screenshot times,
+# becomes NaT.
+def as_datetime64(values):
+    values = [v if isinstance(v, datetime.datetime) else None for v in values]
+    return pd.to_datetime(pd.Series(values, dtype=object)).values.astype('datetime64[ns]')
+
+
+# Save a derived quantity
+def save(name, a, directory=directory):
+    a = np.asarray(a)
+    if a.dtype == object:
+        a = as_datetime64(a)
+    np.save(os.path.join(directory, '{:s}.npy'.format(name)), a)
+
+
+# The dtype of the array stored in a .npy file, read from its header
+def npy_dtype(f):
+    with open(f, 'rb') as fp:
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            return np.lib.format.read_array_header_1_0(fp)[2]
+        return np.lib.format.read_array_header_2_0(fp)[2]
+
+
+# Load a derived quantity by name, without extension.  The typed .npy file is
+# used if it exists, otherwise an older pickle is read and converted.  Typed
+# files are memory-mapped read-only by default, so only the parts of an array
+# that are used are read from disk, and processes loading the same file share
+# the page cache.  Use mmap_mode=None to read the whole array into memory.
+def load(name, directory=directory, mmap_mode='r'):
+    f = os.path.join(directory, '{:s}.npy'.format(name))
+    if os.path.exists(f):
+        if npy_dtype(f) != object:
+            return np.load(f, mmap_mode=mmap_mode)
+        return as_datetime64(np.load(f, allow_pickle=True).ravel())
+
+    f = os.path.join(directory, '{:s}.pkl'.format(name))
+    values = pickle.load(open(f, 'rb'))
+    if len(values) > 0 and isinstance(values[0], (bool, np.bool_)):
+        return np.asarray(values, dtype=bool)
+    return as_datetime64(values)
@@ -0,0 +1,85 @@
+#
+# A request log made of several segments - the current log, the legacy log
+# and any archives added later - read as one logical table.  The segments are
+# kept as separate data frames and are never concatenated, so adding a segment
+# costs only the memory of that segment.
+#
+# Each row gets a global id.  The ids of each segment are moved into their own
+# namespace by adding an offset, so that ids from different segments never
+# collide.
+#
+import numpy as np
+import pandas as pd
+
+import hvorg_trace as hvtrace
+
+
+# The id offset of a segment that follows segments holding nrows rows: the
+# next power of ten above nrows, times ten.  For the legacy log following the
+# current log this is the offset that has always been used.
+def id_offset(nrows):
+    return 10**(1 + int(np.ceil(np.log10(max(nrows, 1)))))
+
+
+class SegmentedLog(object):
+    # 'frames' are the segments in order.  'offsets' are the id offsets of
+    # the segments.  An offset of None follows the id_offset rule, and the
+    # first segment keeps its ids unless told otherwise.  Segments after the
+    # legacy log are also moved above the largest id so far, so that their
+    # ids do not collide with those of the segments before.
+    def __init__(self, frames, offsets=None):
+        self.frames = list(frames)
+        offsets = [None] * len(self.frames) if offsets is None else list(offsets)
+        self.offsets = []
+        nrows = 0
+        max_id = 0
+        for i, (frame, offset) in enumerate(zip(self.frames, offsets)):
+            if offset is None:
+                if i == 0:
+                    offset = 0
+                elif i == 1:
+                    offset = id_offset(nrows)
+                else:
+                    offset = max(id_offset(nrows), id_offset(max_id + 1))
+            self.offsets.append(offset)
+            if 'id' in frame.columns and len(frame) > 0:
+                frame['id'] += offset
+                max_id = max(max_id, int(frame['id'].max()))
+            nrows += len(frame)
+        # Row number of the first row of each segment
+        self.starts = np.cumsum([0] + [len(frame) for frame in self.frames])
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    # Row numbers across all the segments
+    @property
+    def index(self):
+        return pd.RangeIndex(len(self))
+
+    # One column of the whole log.  Only this column is joined; segments
+    # without the column contribute missing values.
+    def column(self, name):
+        parts = [frame[name] if name in frame.columns else pd.Series(np.nan, index=frame.index)
+                 for frame in self.frames]
+        return pd.concat(parts, ignore_index=True)
+
+    # The log in blocks of at most chunksize rows, each indexed by its row
+    # number in the whole log.  Blocks never span two segments.
+    def chunks(self, chunksize):
+        for start, frame in zip(self.starts, self.frames):
+            for first in range(0, len(frame), chunksize):
+                chunk = frame.iloc[first:first + chunksize]
+                yield chunk.set_axis(pd.RangeIndex(start + first, start + first + len(chunk)), axis=0)
+
+
+# Read the segments of a log from CSV files, in order.  'offsets' are the id
+# offsets of the segments, as for SegmentedLog.
+def read(paths, offsets=None):
+    frames = []
+    with hvtrace.stage('read logs', files=len(paths)) as stage:
+        for path in paths:
+            print('Loading ' + path)
+            frames.append(pd.read_csv(path))
+            stage.count(len(frames[-1]))
+    return SegmentedLog(frames, offsets=offsets)
@@ -0,0 +1,63 @@
+#
+# Figures of merit of the movies, calculated in one vectorized pass over the
+# typed time arrays of the derived data
+#
+from collections import OrderedDict
+import numpy as np
+
+import hvorg_time as hvot
+import hvorg_derived as hvod
+
+# The restrictions that can be put on which movies are analyzed
+restrictions = ('observable', 'positive requested duration')
+
+
+# Calculate the figures of merit of the movies from their request, start and
+# end times.  The topicality is the time between the request and either the
+# 'movie_end_time' or the 'movie_start_time'.  The proximity to real time is
+# the time between the request and the movie end time; if it is positive the
+# request was definitely made after the movie end time.  The estimated maximum
+# duration is the part of the movie that could have been observed by the time
+# of the request.  All durations are float64 seconds.  'data_observable' holds
+# the mask of the movies kept under each restriction.
+def movie_metrics(request_time, start_time, end_time, durations=None,
+                  topicality_calculated_using='movie_end_time'):
+    if durations is None:
+        durations = hvot.seconds(end_time - start_time)
+
+    if topicality_calculated_using == 'movie_end_time':
+        topicality = hvot.seconds(request_time - end_time)
+    elif topicality_calculated_using == 'movie_start_time':
+        topicality = hvot.seconds(request_time - start_time)
+    else:
+        raise ValueError('Unknown topicality calculation: ' + topicality_calculated_using)
+
+    proximity_to_real_time = hvot.seconds(request_time - end_time)
+    estimated_maximum_duration = hvot.seconds(np.minimum(request_time, end_time) - start_time)
+
+    # The movie has a non-zero duration
+    positive_duration = durations > 0
+
+    # It was physically possible that we had data for the entire request?
+    physically_possible = proximity_to_real_time > 0
+
+    data_observable = OrderedDict([('observable', positive_duration & physically_possible),
+                                   ('positive requested duration', positive_duration)])
+
+    return OrderedDict([('durations', durations),
+                        ('topicality', topicality),
+                        ('proximity_to_real_time', proximity_to_real_time),
+                        ('estimated_maximum_duration', estimated_maximum_duration),
+                        ('positive_duration', positive_duration),
+                        ('physically_possible', physically_possible),
+                        ('data_observable', data_observable)])
+
+
+# Load the derived times of the movies of an application ('hvorg' or 'jhv')
+# and calculate their figures of merit
+def load_movie_metrics(application_short, directory=hvod.directory, topicality_calculated_using='movie_end_time'):
+    def load(name):
+        return hvod.load('{:s}_movie_{:s}'.format(application_short, name), directory=directory)
+    return movie_metrics(load('request_time'), load('start_time'), load('end_time'),
+                         durations=load('durations_seconds'),
+                         topicality_calculated_using=topicality_calculated_using)
@@ -3,7 +3,6 @@
 #
 
 import os
-import pickle
 from copy import deepcopy
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,8 +11,10 @@ import astropy.units as u
 from sunpy.time import parse_time
 
 import hvorg_style as hvos
-plt.rc('text', usetex=True)
-plt.rc('font', size=14)
+import hvorg_tex as hvotex
+import hvorg_sources as hvsrc
+import hvorg_catalog as hvcat
+hvotex.setup(size=14)
 figsize = (10, 5)
 
 restriction = 'observable'
@@ -35,6 +36,9 @@ data_product = 'movies'
 data_analyzed = '{:s} {:s}'.format(application, data_product)
 data_type = '{:s} ({:s})'.format(data_analyzed, restriction)
 
-# Load in the sources file
-f = os.path.join(directory, 'hvorg_data_source_names.pkl')
-hvorg_data_source_names = pickle.load(open(f, 'rb'))
+# The data source catalog
+catalog = hvcat.load()
+
+# The ids of the data sources used in the movies, and their nicknames
+hvorg_data_source_ids = hvsrc.unique_tokens(hvsrc.load_dictionary(directory, 'hvorg_data_source_ids'))
+hvorg_data_source_names = catalog.nicknames(hvorg_data_source_ids)
@@ -0,0 +1,97 @@
+#
+# Run the prepare steps of the HV analysis.  Each step is run through the
+# derived data cache, so steps whose inputs and code have not changed since
+# they were last run cost almost nothing.  The steps are independent of each
+# other and are run at the same time in a pool of worker processes.
+#
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import hvorg_derived as hvod
+import hvorg_cache as hvcache
+import hvorg_stream as hvstream
+import hvorg_rollup as hvroll
+import hvorg_trace as hvtrace
+
+# Where the source data lives
+source_directory = os.path.expanduser('~/Data/hvanalysis/source')
+
+# Number of prepare steps run at the same time
+workers = 5
+
+# Number of worker processes each step uses to parse its times
+parse_workers = 1
+
+# Bring the rollup cube of request counts up to date after the steps
+rollup = True
+# rollup = False
+
+# The prepare steps, the script that runs each one, the source files it reads,
+# the patterns matching the names of the derived files it writes and the
+# names of the watermarks of the logs it can prepare a chunk at a time
+steps = OrderedDict([('hvorg_movies', {'script': 'hvorg_movies_prepare.py',
+                                       'inputs': ['movies_20171128.csv', 'movies_legacy.csv', 'getDataSources.json'],
+                                       'outputs': ['hvorg_movie_*', 'hvorg_data_source_*',
+                                                   'hvorg_sourceids_and_nicknames.pkl'],
+                                       'watermarks': ['hvorg_movie']}),
+                     ('hvorg_screenshots', {'script': 'hvorg_screenshots_prepare.py',
+                                            'inputs': ['screenshots.csv', 'screenshots_legacy.csv',
+                                                       'getDataSources.json'],
+                                            'outputs': ['hvorg_screenshot_*'],
+                                            'watermarks': ['hvorg_screenshot']}),
+                     ('hvorg_embeds', {'script': 'hvorg_embed_timestamps_only.py',
+                                       'inputs': ['embed.csv'],
+                                       'outputs': ['hvorg_embed_*']}),
+                     ('jhv_movies', {'script': 'jhv_movies_prepare.py',
+                                     'inputs': ['jpx.csv', 'getDataSources.json'],
+                                     'outputs': ['jhv_movie_*_seconds.npy', 'jhv_movie_*_time.npy',
+                                                 'jhv_movie_watermark.json', 'jhv_data_source_*'],
+                                     'watermarks': ['jhv_movie']}),
+                     ('jhv_movies_timestamps_only', {'script': 'jhv_movies_prepare_timestamps_only.py',
+                                                     'inputs': ['jhv_request_statistics.csv'],
+                                                     'outputs': ['jhv_movie_request_timestamps_only.*']})])
+
+
+# Run one prepare step through the cache, parsing its times with parse_workers
+# processes.  The parameters, such as prepare_mode and chunksize, are passed
+# in to the script.  Returns True if the step was run.  The trace of the step is
+# written when it finishes, since worker processes do not write theirs at
+# exit.
+def run_step(name, parameters=None, parse_workers=parse_workers, max_size=hvcache.max_size):
+    step = steps[name]
+    hvstream.workers = parse_workers
+    script = os.path.join(hvcache.code_directory, step['script'])
+    inputs = [os.path.join(source_directory, f) for f in step['inputs']]
+    watermarks = [os.path.basename(hvstream.watermark_path('', w)) for w in step.get('watermarks', [])]
+    with hvtrace.stage('step {:s}'.format(name)):
+        ran = hvcache.run_step(name, script, inputs, parameters=parameters, outputs=step['outputs'],
+                               watermarks=watermarks, save_directory=hvod.directory, max_size=max_size)
+    hvtrace.save(script=name)
+    return ran
+
+
+# Run the prepare steps, up to 'workers' of them at the same time.  The cache
+# is trimmed once all the steps have finished, and then the rollup cube is
+# updated with the new requests.
+def run(names=None, parameters=None, workers=workers, parse_workers=parse_workers, max_size=hvcache.max_size,
+        rollup=rollup):
+    names = list(steps.keys()) if names is None else names
+    if workers <= 1:
+        ran = OrderedDict((name, run_step(name, parameters=parameters, parse_workers=parse_workers, max_size=None))
+                          for name in names)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = OrderedDict((name, executor.submit(run_step, name, parameters=parameters,
+                                                         parse_workers=parse_workers, max_size=None))
+                                  for name in names)
+            ran = OrderedDict((name, future.result()) for name, future in futures.items())
+    hvcache.evict(max_size=max_size)
+    if rollup:
+        with hvtrace.stage('rollup'):
+            hvroll.update_all()
+    return ran
+
+
+if __name__ == '__main__':
+    run()
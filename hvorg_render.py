@@ -0,0 +1,358 @@
+#
+# Rendering of the analysis figures in a pool of worker processes.  Each figure
+# is described by a dictionary: the function that draws it, the data it draws,
+# the keyword arguments of the function, its size and where it is saved.  The
+# figures are independent of each other, so once the arrays are calculated
+# they can all be drawn at the same time.  Large arrays are shared with the
+# workers as memory-mapped .npy files rather than copied to each one.
+#
+# Each figure has a fingerprint: a hash of its data, its keyword arguments,
+# its size, the matplotlib settings and the code that draws it.  A manifest
+# records the fingerprint of every figure saved.  A figure whose saved image
+# is unchanged and whose fingerprint is the same is not drawn again, so
+# changing one figure only costs the time to draw that one.
+#
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+from matplotlib.text import Text
+
+import hvorg_derived as hvod
+import hvorg_tex as hvotex
+import hvorg_cache as hvcache
+import hvorg_trace as hvtrace
+
+# Where arrays shared with the workers are written
+scratch_directory = os.path.join(hvod.directory, 'render')
+
+# Number of figures drawn at the same time
+workers = os.cpu_count() or 1
+
+# Skip figures that have already been drawn
+cache = True
+# cache = False
+
+# Fingerprints of the figures already drawn
+manifest_path = os.path.join(scratch_directory, 'manifest.json')
+
+# Arrays larger than this many bytes are passed to the workers through
+# memory-mapped files rather than pickled
+share_size = 1 << 20
+
+
+# A reference to an array shared through a memory-mapped .npy file
+class Shared(object):
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return np.load(self.path, mmap_mode='r')
+
+
+# Share an array with the workers.  Returns the reference to pass as figure
+# data in place of the array.
+def share(name, a, directory=scratch_directory):
+    os.makedirs(directory, exist_ok=True)
+    f = os.path.join(directory, '{:s}.npy'.format(name))
+    np.save(f, np.asarray(a))
+    return Shared(f)
+
+
+# A description of a figure in which the arrays larger than share_size are
+# shared with the workers.  Returns it and the files written, to be removed
+# once the figure is drawn.
+def share_data(description, name, directory=scratch_directory):
+    data = {}
+    files = []
+    for key, value in description['data'].items():
+        if isinstance(value, np.ndarray) and value.nbytes > share_size and not value.dtype.hasobject:
+            value = share('{:s}_{:s}'.format(name, key), value, directory=directory)
+            files.append(value.path)
+        data[key] = value
+    return dict(description, data=data), files
+
+
+# Describe a figure.  'draw' is called as draw(ax, **data, **kwargs), and must
+# be a function defined in a module so that the workers can find it.
+def figure(draw, filepath, data=None, figsize=None, **kwargs):
+    return {'draw': draw,
+            'filepath': filepath,
+            'data': {} if data is None else data,
+            'figsize': figsize,
+            'kwargs': kwargs}
+
+
+# Make the figure of a description, without drawing it
+def make_figure(description):
+    data = dict((key, value.load() if isinstance(value, Shared) else value)
+                for key, value in description['data'].items())
+    kwargs = dict(description['kwargs'])
+    kwargs.update(data)
+    fig = plt.figure(figsize=description['figsize'])
+    ax = fig.add_subplot(111)
+    description['draw'](ax, **kwargs)
+    return fig
+
+
+# Draw one figure and save it.  Returns where it was saved, and when and for
+# how long it was drawn and by which process, for the trace.
+def render_one(description, rc=None):
+    start = time.time()
+    cpu = hvtrace.cpu_time()
+    if rc is not None:
+        matplotlib.rcParams.update(rc)
+    fig = make_figure(description)
+    if hvotex.is_draft():
+        hvotex.draft_figure(fig)
+    fig.tight_layout()
+    fig.savefig(description['filepath'])
+    plt.close(fig)
+    return {'filepath': description['filepath'],
+            'start': start,
+            'duration': time.time() - start,
+            'cpu_seconds': hvtrace.cpu_time() - cpu,
+            'pid': os.getpid()}
+
+
+# The matplotlib settings of this process, to be used by the workers
+def current_rc():
+    return dict((key, value) for key, value in matplotlib.rcParams.items() if key != 'backend')
+
+
+# The text of a figure to be typeset and the font size of each: the labels,
+# title, legend and colorbar, and the labels of the ticks as the axes would
+# format them.  The figure is made to find them but not drawn, which costs
+# little next to typesetting.
+def texts(description):
+    fig = make_figure(description)
+    found = [(t.get_text(), t.get_fontsize()) for t in fig.findobj(Text) if t.get_visible() and t.get_text()]
+    for ax in fig.axes:
+        for axis in (ax.xaxis, ax.yaxis):
+            if not axis.get_visible():
+                continue
+            low, high = sorted(axis.get_view_interval())
+            for ticker, ticks, locs in ((axis.major, axis.get_major_ticks, axis.get_majorticklocs()),
+                                        (axis.minor, axis.get_minor_ticks, axis.get_minorticklocs())):
+                if len(locs) == 0:
+                    continue
+                size = ticks(1)[0].label1.get_fontsize()
+                labels = ticker.formatter.format_ticks(locs)
+                found.extend((label, size) for loc, label in zip(locs, labels) if label and low <= loc <= high)
+    plt.close(fig)
+    return found
+
+
+# The fingerprint of a figure drawn with the matplotlib settings 'rc'
+def fingerprint(description, rc):
+    h = hashlib.sha1()
+    h.update('draw {:s}.{:s}\n'.format(description['draw'].__module__, description['draw'].__name__).encode('utf-8'))
+    for f in hvcache.code_files(__file__):
+        h.update('code {:s} {:s}\n'.format(os.path.basename(f), hvcache.file_hash(f)).encode('utf-8'))
+    for key in sorted(description['data']):
+        value = description['data'][key]
+        if isinstance(value, Shared):
+            h.update('data {:s} {:s}\n'.format(key, hvcache.file_hash(value.path)).encode('utf-8'))
+        else:
+            a = np.ascontiguousarray(value)
+            h.update('data {:s} {:s} {:s}\n'.format(key, str(a.dtype), str(a.shape)).encode('utf-8'))
+            h.update(a.tobytes())
+    h.update('figsize {:s}\n'.format(json.dumps(description['figsize'])).encode('utf-8'))
+    h.update('kwargs {:s}\n'.format(json.dumps(description['kwargs'], sort_keys=True, default=repr)).encode('utf-8'))
+    h.update('rc {:s}\n'.format(json.dumps(rc, sort_keys=True, default=repr)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_manifest(path=manifest_path):
+    return json.load(open(path, 'r')) if os.path.exists(path) else {}
+
+
+# The manifest is replaced in one go so that it is never seen half written
+def save_manifest(manifest, path=manifest_path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    json.dump(manifest, open('{:s}.{:d}'.format(path, os.getpid()), 'w'), indent=1)
+    os.rename('{:s}.{:d}'.format(path, os.getpid()), path)
+
+
+# Size and modification time of a saved image, or None if there is none
+def image_stat(filepath):
+    if not os.path.exists(filepath):
+        return None
+    stat = os.stat(filepath)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# Is the saved image of a figure the one drawn for this fingerprint?
+def is_drawn(filepath, key, manifest):
+    entry = manifest.get(filepath)
+    return entry is not None and entry['key'] == key and entry['stat'] == image_stat(filepath)
+
+
+# Remove the images drawn before for a group of figures that are no longer
+# among them.  Images changed since they were drawn are left alone.
+def prune(manifest, group, keep):
+    for filepath in list(manifest.keys()):
+        entry = manifest[filepath]
+        if entry['group'] != group or filepath in keep:
+            continue
+        if entry['stat'] == image_stat(filepath):
+            print('Removing ' + filepath)
+            os.remove(filepath)
+        del manifest[filepath]
+
+
+# Draw all the figures, up to 'workers' at the same time, with the matplotlib
+# settings of this process.  Figures already drawn with the same fingerprint
+# are skipped.  The text of the figures to draw is typeset first, each
+# distinct piece once.  If a group is given, images drawn before for that
+# group but not among these figures are removed.  Returns where the figures
+# were saved.
+def render(descriptions, workers=workers, group=None, manifest_path=manifest_path):
+    rc = current_rc()
+    filepaths = [os.path.abspath(description['filepath']) for description in descriptions]
+    keys = [fingerprint(description, rc) for description in descriptions]
+    manifest = load_manifest(manifest_path)
+    todo = [i for i in range(len(descriptions)) if not (cache and is_drawn(filepaths[i], keys[i], manifest))]
+    draw = [descriptions[i] for i in todo]
+
+    with hvtrace.stage('render', rows=len(draw), skipped=len(descriptions) - len(draw)):
+        if not hvotex.is_draft():
+            with hvtrace.stage('typeset'):
+                hvotex.typeset([t for description in draw for t in texts(description)], workers=workers, rc=rc)
+        if workers <= 1 or len(draw) <= 1:
+            drawn = [render_one(description) for description in draw]
+        else:
+            shared = [share_data(description, '{:d}_{:d}'.format(os.getpid(), i))
+                      for i, description in enumerate(draw)]
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(draw))) as executor:
+                    drawn = list(executor.map(render_one, [d for d, files in shared], [rc] * len(draw)))
+            finally:
+                for d, files in shared:
+                    for f in files:
+                        os.remove(f)
+        for d in drawn:
+            hvtrace.record('figure {:s}'.format(os.path.basename(d['filepath'])), d['start'], d['duration'],
+                           args={'cpu_seconds': d['cpu_seconds']}, tid=d['pid'])
+
+    for i in todo:
+        manifest[filepaths[i]] = {'key': keys[i], 'stat': image_stat(filepaths[i]), 'group': group}
+    if group is not None:
+        prune(manifest, group, set(filepaths))
+    save_manifest(manifest, manifest_path)
+    return [description['filepath'] for description in descriptions]
+
+
+# The positions in 'unit' and the keyword arguments of the reference lines
+# hvos.lines, or those picked out by hvos.relevant_lines.  The lines are
+# labelled unless label is False.
+def line_positions(lines, unit, label=True):
+    positions = []
+    for key in list(lines.keys()):
+        kwargs = dict(lines[key])
+        if label:
+            kwargs['label'] = str(key)
+        positions.append((key.to(unit).value, kwargs))
+    return positions
+
+
+# Kinds of figure
+
+# A histogram with a log count axis, drawn from counts and bin edges, with
+# vertical reference lines
+def histogram(ax, counts, edges, xlabel, ylabel, title, vlines=(), xlim=None, label=None, legend=False,
+              framealpha=None):
+    ax.hist(edges[:-1], bins=edges, weights=counts, label=label)
+    ax.grid(True, linestyle='dotted')
+    for position, kwargs in vlines:
+        ax.axvline(position, **kwargs)
+    ax.set_yscale('log')
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    if xlim is not None:
+        ax.set_xlim(*xlim)
+    if legend:
+        ax.legend(framealpha=framealpha)
+
+
+# A log-log density image of points counted in two dimensional bins by
+# hvcount.log_histogram2d, with a line of equality and reference lines.  The
+# time taken to draw it and the size of the file do not depend on the number
+# of points.  'equality' is the range of the line of equality.  The legend is
+# placed at a fixed location, since finding the best one among the bins is
+# slow.
+def density(ax, counts, xedges, yedges, xlabel, ylabel, title, equality, vlines=(), hlines=(), clabel=None,
+            cmap='viridis', legend_loc='lower right'):
+    image = ax.pcolormesh(xedges, yedges, np.ma.masked_equal(np.asarray(counts).T, 0),
+                          norm=LogNorm(), cmap=cmap, rasterized=True)
+    ax.set_yscale('log')
+    ax.set_xscale('log')
+    ax.plot(equality, equality, color='k', label='equality')
+    for position, kwargs in vlines:
+        ax.axvline(position, **kwargs)
+    for position, kwargs in hlines:
+        ax.axhline(position, **kwargs)
+    cbar = ax.figure.colorbar(image, ax=ax)
+    if clabel is not None:
+        cbar.set_label(clabel)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.legend(loc=legend_loc)
+    ax.set_title(title)
+
+
+# A bar chart of counts, one bar for each tick label, as drawn by
+# DataFrame.plot(kind='bar')
+def bars(ax, counts, ticklabels, label, xlabel, ylabel, title, ticksize=10, rotation=65):
+    positions = np.arange(len(counts))
+    ax.bar(positions, counts, width=0.5, label=label)
+    ax.set_xticks(positions)
+    ax.set_xticklabels(ticklabels)
+    ax.set_title(title)
+    ax.set_ylabel(ylabel)
+    ax.set_xlabel(xlabel)
+    ax.xaxis.set_tick_params(labelsize=ticksize)
+    ax.grid(linestyle='dotted')
+    ax.figure.autofmt_xdate(rotation=rotation)
+    ax.legend()
+
+
+# A log-log scatter of the daily usage of two services, the days before a
+# date and the days after it in different colours, optionally with a line of
+# best fit through (log10 x, log10 y) and a line of equality
+def usage_scatter(ax, xb, yb, xa, ya, before_label, after_label, xlabel, ylabel, title, fit=None, fit_label=None,
+                  equality=False, size=1.5, after_color='m', after_marker='s', lim=(1, 10000)):
+    ax.scatter(xb, yb, s=size, label=before_label)
+    ax.scatter(xa, ya, s=size, color=after_color, marker=after_marker, label=after_label)
+    if fit is not None:
+        x = np.arange(0, 4.0, 0.001)
+        ax.plot(10**x, 10.0**np.polyval(fit, x), color='k', label=fit_label)
+    if equality:
+        ax.plot(lim, lim, linestyle=':', color='k', label='equality')
+    ax.set_yscale('log')
+    ax.set_xscale('log')
+    ax.set_xlim(*lim)
+    ax.set_ylim(*lim)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.grid(True, linestyle='dotted')
+    ax.legend(framealpha=0.3, fontsize=10, facecolor='y')
+
+
+# A matrix of correlation coefficients between -1 and 1, with the same labels
+# on both axes
+def correlation_matrix(ax, rho, ticklabels, title, clabel):
+    image = ax.imshow(rho, vmin=-1, vmax=1, cmap='RdBu_r')
+    ax.set_xticks(np.arange(len(ticklabels)))
+    ax.set_yticks(np.arange(len(ticklabels)))
+    ax.set_xticklabels(ticklabels)
+    ax.set_yticklabels(ticklabels)
+    ax.figure.colorbar(image, ax=ax, label=clabel)
+    ax.set_title(title)
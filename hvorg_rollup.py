@@ -0,0 +1,285 @@
+#
+# Rollup cube of the number of requests made to each service, at minute,
+# hour, day, week, month and quarter resolution, and optionally per data
+# source at day resolution and coarser.  The cube is built from the derived
+# request times and kept in the derived directory.  When a request time file
+# has grown, only the new requests are counted and added to the cube, so
+# reading counts from the cube costs almost nothing once it is up to date.
+#
+import os
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import hvorg_derived as hvod
+import hvorg_counts as hvcount
+import hvorg_sources as hvsrc
+
+# Where the cube is kept
+rollup_directory = os.path.join(hvod.directory, 'rollup')
+
+# The resolutions of the cube
+freqs = hvcount.freqs
+
+# The resolutions of the per data source counts
+source_freqs = ('D', 'W', 'M', 'Q')
+
+# The services in the cube: the derived request times of each, and the data
+# source incidence matrix of the requests, if there is one
+services = OrderedDict([('hvorg_movie', {'times': 'hvorg_movie_request_time',
+                                         'incidence': 'hvorg_data_source_ids'}),
+                        ('hvorg_screenshot', {'times': 'hvorg_screenshot_request_time',
+                                              'incidence': 'hvorg_screenshot_data_source_ids'}),
+                        ('hvorg_embed', {'times': 'hvorg_embed_request_timestamps_only'}),
+                        ('jhv_movie', {'times': 'jhv_movie_request_time',
+                                       'incidence': 'jhv_data_source_ids'}),
+                        ('jhv_movie_timestamps_only', {'times': 'jhv_movie_request_timestamps_only'})])
+
+
+def state_path(service, rollup_directory=rollup_directory):
+    return os.path.join(rollup_directory, '{:s}.json'.format(service))
+
+
+def counts_path(service, freq, rollup_directory=rollup_directory):
+    return os.path.join(rollup_directory, '{:s}_{:s}.npy'.format(service, freq))
+
+
+def source_counts_path(service, freq, rollup_directory=rollup_directory):
+    return os.path.join(rollup_directory, '{:s}_sources_{:s}.npy'.format(service, freq))
+
+
+def load_state(service, rollup_directory=rollup_directory):
+    f = state_path(service, rollup_directory)
+    return json.load(open(f, 'r')) if os.path.exists(f) else None
+
+
+# Write a file in one go: 'write' writes to an open temporary file, which is
+# then moved into place, so that the file is never seen half written
+def write_atomic(f, write, mode='wb'):
+    tmp = '{:s}.{:d}'.format(f, os.getpid())
+    with open(tmp, mode) as fp:
+        write(fp)
+    os.replace(tmp, f)
+
+
+def save_counts(f, counts):
+    write_atomic(f, lambda fp: np.save(fp, counts))
+
+
+def save_state(service, state, rollup_directory=rollup_directory):
+    write_atomic(state_path(service, rollup_directory), lambda fp: json.dump(state, fp, indent=1), mode='w')
+
+
+# Size and modification time of the derived request times of a service
+def times_stat(service, directory=hvod.directory):
+    f = os.path.join(directory, '{:s}.npy'.format(services[service]['times']))
+    if not os.path.exists(f):
+        f = os.path.join(directory, '{:s}.pkl'.format(services[service]['times']))
+    stat = os.stat(f)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# SHA-1 of the first 'rows' request times, read a block at a time
+def checksum(times, rows, block=1 << 22):
+    h = hashlib.sha1()
+    for start in range(0, rows, block):
+        h.update(np.ascontiguousarray(times[start:min(start + block, rows)]).view(np.int64))
+    return h.hexdigest()
+
+
+# Add counts starting at bin 'first' to counts starting at bin 'old_first'.
+# The bins are extended as needed.  Works along the first axis, so the counts
+# can have one column per data source.  Returns the sum and its first bin.
+def add_counts(old, old_first, new, first):
+    if old is None or len(old) == 0:
+        return new, first
+    if len(new) == 0:
+        return old, old_first
+    start = min(old_first, first)
+    stop = max(old_first + len(old), first + len(new))
+    total = np.zeros((stop - start,) + old.shape[1:], dtype=np.int64)
+    total[old_first - start:old_first - start + len(old)] += old
+    total[first - start:first - start + len(new)] += new
+    return total, start
+
+
+# Count times in bins, starting from the bin of the earliest time
+def bin_counts(times, freq):
+    times = times[~np.isnat(times)]
+    if len(times) == 0:
+        return np.zeros(0, dtype=np.int64), 0
+    numbers = hvcount.bin_numbers(times, freq)
+    first = int(numbers.min())
+    return np.bincount(numbers - first).astype(np.int64), first
+
+
+# Count the requests using each data source in bins.  'incidence' is the data
+# source incidence matrix of the requests.
+def bin_source_counts(times, incidence, freq):
+    valid = ~np.isnat(times)
+    if not np.any(valid):
+        return np.zeros((0, incidence.shape[1]), dtype=np.int64), 0
+    numbers = hvcount.bin_numbers(times[valid], freq)
+    first = int(numbers.min())
+    nbins = int(numbers.max()) - first + 1
+    rows = np.flatnonzero(valid)
+    bins = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (numbers - first, rows)),
+                             shape=(nbins, incidence.shape[0]))
+    return np.asarray(bins.dot(incidence.astype(np.int64)).todense()), first
+
+
+# Bring the cube of a service up to date with its derived request times.  The
+# times are not read again if the size and modification time of their file
+# have not changed.  Otherwise only the requests added since the last update
+# are counted, unless a checksum shows the times already counted have
+# changed, in which case the cube of the service is rebuilt.  The state is
+# removed while the counts are rewritten, so an update that is interrupted
+# leads to a rebuild rather than requests counted twice.  Returns the number
+# of requests counted.
+def update(service, directory=hvod.directory, rollup_directory=rollup_directory, sources=True):
+    os.makedirs(rollup_directory, exist_ok=True)
+    state = load_state(service, rollup_directory)
+    stat = times_stat(service, directory)
+    if state is not None and state.get('stat') == stat:
+        return 0
+    times = hvod.load(services[service]['times'], directory=directory)
+
+    # The cube is only extended if the requests already counted are unchanged
+    if state is not None:
+        rows = state['rows']
+        if rows > len(times) or state.get('checksum') != checksum(times, rows):
+            state = None
+    if state is not None and state['rows'] == len(times):
+        state['stat'] = stat
+        save_state(service, state, rollup_directory)
+        return 0
+
+    if state is None:
+        state = {'rows': 0, 'checksum': None, 'stat': None, 'first': {}, 'sources': None, 'source_first': {}}
+    rows = state['rows']
+    new_times = np.asarray(times[rows:])
+    if os.path.exists(state_path(service, rollup_directory)):
+        os.remove(state_path(service, rollup_directory))
+
+    for freq in freqs:
+        f = counts_path(service, freq, rollup_directory)
+        old = np.load(f) if rows > 0 else None
+        counts, first = add_counts(old, state['first'].get(freq), *bin_counts(new_times, freq))
+        save_counts(f, counts)
+        state['first'][freq] = first
+
+    incidence_name = services[service].get('incidence')
+    incidence_file = None if incidence_name is None else os.path.join(directory, '{:s}.npz'.format(incidence_name))
+    if sources and incidence_file is not None and os.path.exists(incidence_file):
+        incidence = hvsrc.load_incidence(incidence_file)
+        if incidence.shape[0] == len(times):
+            # All the requests are counted if the data sources were not
+            # counted before
+            source_rows = rows if state['sources'] is not None else 0
+            incidence = incidence[source_rows:]
+            nsources = incidence.shape[1]
+            for freq in source_freqs:
+                f = source_counts_path(service, freq, rollup_directory)
+                old = None
+                if source_rows > 0:
+                    old = np.load(f)
+                    # New data sources add columns
+                    old = np.hstack([old, np.zeros((len(old), nsources - old.shape[1]), dtype=np.int64)])
+                counts, first = add_counts(old, state['source_first'].get(freq),
+                                           *bin_source_counts(np.asarray(times[source_rows:]), incidence, freq))
+                save_counts(f, counts)
+                state['source_first'][freq] = first
+            state['sources'] = nsources
+
+    state['rows'] = len(times)
+    state['checksum'] = checksum(times, len(times))
+    state['stat'] = stat
+    save_state(service, state, rollup_directory)
+    return len(new_times)
+
+
+# The number of requests to a service in each bin at one resolution, as a
+# Series indexed by the time labelling each bin.  The cube is brought up to
+# date first.  If given, start and end select the bins holding those times.
+def counts(service, freq='D', start=None, end=None, name=None, directory=hvod.directory,
+           rollup_directory=rollup_directory):
+    update(service, directory=directory, rollup_directory=rollup_directory)
+    state = load_state(service, rollup_directory)
+    c = np.load(counts_path(service, freq, rollup_directory), mmap_mode='r')
+    return select(c, state['first'][freq], freq, start=start, end=end, name=name)
+
+
+# The number of requests to a service that used each data source, in each bin
+# at one resolution, as a DataFrame with one column per data source
+def source_counts(service, freq='D', start=None, end=None, columns=None, directory=hvod.directory,
+                  rollup_directory=rollup_directory):
+    update(service, directory=directory, rollup_directory=rollup_directory)
+    state = load_state(service, rollup_directory)
+    c = np.load(source_counts_path(service, freq, rollup_directory), mmap_mode='r')
+    s = select(np.arange(len(c)), state['source_first'][freq], freq, start=start, end=end)
+    return pd.DataFrame(np.asarray(c[s.values]), index=s.index, columns=columns)
+
+
+# The number of requests to each of several services in each bin at one
+# resolution, as a DataFrame with one column per service, named by 'names' if
+# given.  The bins run over the window in which all the services have
+# requests if 'window' is 'common', or over the window in which any of them
+# has if it is 'union', in which case bins outside the requests of a service
+# are zero.  If given, start and end narrow the window further.
+def count_matrix(services, freq='D', window='common', start=None, end=None, names=None, directory=hvod.directory,
+                 rollup_directory=rollup_directory):
+    cubes = []
+    for service in services:
+        update(service, directory=directory, rollup_directory=rollup_directory)
+        cubes.append((np.load(counts_path(service, freq, rollup_directory), mmap_mode='r'),
+                      load_state(service, rollup_directory)['first'][freq]))
+    firsts = np.array([first for c, first in cubes], dtype=np.int64)
+    lasts = firsts + np.array([len(c) for c, first in cubes], dtype=np.int64) - 1
+    if window == 'common':
+        lo, hi = firsts.max(), lasts.min()
+    elif window == 'union':
+        lo, hi = firsts.min(), lasts.max()
+    else:
+        raise ValueError('Unknown window: {:s}'.format(str(window)))
+    if start is not None:
+        lo = max(lo, int(hvcount.bin_numbers([pd.Timestamp(start)], freq)[0]))
+    if end is not None:
+        hi = min(hi, int(hvcount.bin_numbers([pd.Timestamp(end)], freq)[0]))
+
+    m = np.zeros((max(hi - lo + 1, 0), len(cubes)), dtype=np.int64)
+    for j, (c, first) in enumerate(cubes):
+        a = max(lo, first)
+        b = min(hi, first + len(c) - 1)
+        if b >= a:
+            m[a - lo:b - lo + 1, j] = c[a - first:b - first + 1]
+    labels = hvcount.bin_labels(np.arange(lo, lo + len(m)), freq).astype('datetime64[ns]')
+    return pd.DataFrame(m, index=pd.DatetimeIndex(labels, name='date'),
+                        columns=list(services) if names is None else list(names))
+
+
+# Cut the bins holding the times from start to end out of counts starting at
+# bin 'first'.  Bins outside the counts are zero.
+def select(c, first, freq, start=None, end=None, name=None):
+    lo = first if start is None else int(hvcount.bin_numbers([pd.Timestamp(start)], freq)[0])
+    hi = first + len(c) - 1 if end is None else int(hvcount.bin_numbers([pd.Timestamp(end)], freq)[0])
+    out = np.zeros(max(hi - lo + 1, 0), dtype=np.asarray(c[:0]).dtype)
+    a = max(lo, first)
+    b = min(hi, first + len(c) - 1)
+    if b >= a:
+        out[a - lo:b - lo + 1] = c[a - first:b - first + 1]
+    return hvcount.counts_series(out, lo, freq, name=name)
+
+
+# Bring the whole cube up to date
+def update_all(directory=hvod.directory, rollup_directory=rollup_directory):
+    for service in services:
+        if os.path.exists(os.path.join(directory, '{:s}.npy'.format(services[service]['times']))):
+            print('Rolling up ' + service)
+            update(service, directory=directory, rollup_directory=rollup_directory)
+
+
+if __name__ == '__main__':
+    update_all()
@@ -3,20 +3,24 @@
 #
 
 import os
-import pickle
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 import astropy.units as u
 from sunpy.time import parse_time
 
 import hvorg_style as hvos
-plt.rc('text', usetex=True)
-plt.rc('font', size=14)
+import hvorg_tex as hvotex
+import hvorg_time as hvot
+import hvorg_derived as hvod
+import hvorg_counts as hvcount
+import hvorg_render as hvrender
+import hvorg_rollup as hvroll
+import hvorg_trace as hvtrace
+hvotex.setup(size=14)
 figsize = (10, 5)
 
 # Read in the data
-directory = os.path.expanduser('~/Data/hvanalysis/derived')
+directory = hvod.directory
 
 # Image output location
 img = hvos.img
@@ -31,43 +35,41 @@ data_product = 'screenshots'
 data_analyzed = '{:s} {:s}'.format(application, data_product)
 data_type = '{:s}'.format(data_analyzed)
 
+load = hvtrace.begin('load derived data')
+
 # Time difference
-f = os.path.join(directory, 'hvorg_screenshot_time_difference_seconds.npy')
-td = np.load(f) * u.s
+time_difference = hvod.load('hvorg_screenshot_time_difference_seconds', directory=directory)
 topicality_subtitle = "{:s} = {:s} - {:s}".format(hvos.durations['tmtopicality'][0], hvos.dates['Tmrequest'], hvos.dates['Tsdate'])
 
 # Screenshot request times
-f = os.path.join(directory, "hvorg_screenshot_request_time.pkl")
-screenshot_request_time = pickle.load(open(f, 'rb'))
+screenshot_request_time = hvod.load("hvorg_screenshot_request_time", directory=directory)
+load.end()
 
 # Number of screenshots
-nmovies = len(td)
+nmovies = len(time_difference)
+
+# The figures drawn at the same time
+figures = []
 
 # Figure 1 : topicality
 # Scale size we are interested in
 topicality_unit = u.year
 
-# Define the topicality on the scale size
-topicality = td.to(topicality_unit).value
+# Sorted index of the topicalities, from which the histograms are counted
+with hvtrace.stage('sorted index', rows=nmovies):
+    topicality_index = hvcount.SortedIndex(time_difference)
 
 # Histogram bins
 topicality_bins = 100
-
-# make the plot
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-plt.hist(topicality, bins=topicality_bins)
-ax.grid(True, linestyle='dotted')
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(topicality_unit)))
-plt.ylabel(hvos.mlabel(len(td), data_type=data_product))
-plt.title('{{{:s}}}\n{{{:s}}}'.format(data_type, topicality_subtitle))
-plt.tight_layout()
+topicality_counts, topicality_edges = topicality_index.histogram(topicality_bins)
 filename = hvos.overleaf(os.path.join(data_type, 'topicality'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': topicality_counts,
+                                     'edges': hvot.in_unit(topicality_edges, topicality_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(topicality_unit)),
+                               ylabel=hvos.mlabel(len(time_difference), data_type=data_product),
+                               title='{{{:s}}}\n{{{:s}}}'.format(data_type, topicality_subtitle)))
 
 
 # Figure 2: topicality < 30 days
@@ -77,80 +79,78 @@ td_short_unit = u.day
 # Longest possible topicality
 td_short_limit = 30*u.day
 
-# Find the topicalities less than the longest possible
-topicality = td.to(td_short_unit)
-these = np.abs(topicality) < td_short_limit
-topicality = topicality[these].value
-
 # Histogram bins
 topicality_bins = int(td_short_limit.to(td_short_unit).value*24)
 
-# Fix the bin size
-td_short_fraction = 24
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-plt.hist(topicality, bins=topicality_bins)
-ax.grid(True, linestyle='dotted')
+# Count the topicalities less than the longest possible
+topicality_counts, topicality_edges = topicality_index.histogram(topicality_bins,
+                                                                 low=-hvot.quantity_seconds(td_short_limit),
+                                                                 high=hvot.quantity_seconds(td_short_limit),
+                                                                 low_inclusive=False, high_inclusive=False)
 rl = hvos.relevant_lines(hvos.lines, tr=[0, 30]*u.day)
-for key in list(rl.keys()):
-    kwargs = rl[key]
-    kwargs['label'] = str(key)
-    plt.axvline(key.to(td_short_unit).value, **kwargs)
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)))
-plt.ylabel(hvos.mlabel(len(topicality), data_type=data_product))
-plt.title('{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, topicality_subtitle, "$\le$", td_short_limit))
-plt.legend()
-plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, 'topicality_{:s}'.format(str(td_short_limit))))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': topicality_counts,
+                                     'edges': hvot.in_unit(topicality_edges, td_short_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)),
+                               ylabel=hvos.mlabel(np.sum(topicality_counts), data_type=data_product),
+                               title='{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, topicality_subtitle, "$\leq$", td_short_limit),
+                               vlines=hvrender.line_positions(rl, td_short_unit),
+                               legend=True))
 
 
 # Figure 6
 # Number of requests as a function of time
 title = 'screenshots per quarter'
-df = pd.DataFrame(screenshot_request_time, columns=['date'])
-# Setting the date as the index since the TimeGrouper works on Index, the date column is not dropped to be able to count
-df.set_index('date', drop=False, inplace=True)
-
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='Q')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
-h.plot(kind='bar', ax=ax)
-new_ticks = []
-for dt in h.index:
-    new_ticks.append(dt.to_datetime())
-ax.set_xticklabels([dt.strftime('%Y-%m-%d') for dt in new_ticks])
-ax.set_title(title)
-ax.set_ylabel(hvos.mlabel(len(screenshot_request_time)))
-ax.set_xlabel('date')
-ax.xaxis.set_tick_params(labelsize=10)
-ax.grid(linestyle='dotted')
-fig.autofmt_xdate(rotation=65)
-plt.legend()
-plt.tight_layout()
+with hvtrace.stage('binning'):
+    h = hvroll.counts('hvorg_screenshot', 'Q', name='movies', directory=directory)
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.bars, os.path.join(img, filename),
+                               data={'counts': h.values},
+                               ticklabels=[dt.strftime('%Y-%m-%d') for dt in h.index.to_pydatetime()],
+                               label='movies',
+                               xlabel='date',
+                               ylabel=hvos.mlabel(len(screenshot_request_time)),
+                               title=title))
+
+# Daily numbers, drawn as a plot in figure 7 and as a distribution in figure 8
+with hvtrace.stage('binning'):
+    h = hvroll.counts('hvorg_screenshot', 'D', name='movies', directory=directory).to_frame()
+movies_per_day = np.asarray(list(h["movies"]))
+mean = int(np.rint(np.mean(movies_per_day)))
+median = int(np.rint(np.median(movies_per_day)))
+
+# Figure 8
+# Distribution of the number of screenshots made per day
+title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
+per_day_counts, per_day_edges = np.histogram(movies_per_day, bins=60)
+per_day_lines = [(mean, {'color': 'r', 'linestyle': 'dashed', 'label': 'mean ({{{:n}}})'.format(mean)}),
+                 (median, {'color': 'k', 'linestyle': 'dashed', 'label': 'median ({{{:n}}})'.format(median)})]
+filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
+filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': per_day_counts, 'edges': per_day_edges},
+                               label='movies',
+                               vlines=per_day_lines,
+                               xlabel='number of movies per day',
+                               ylabel='number of days\n[{{{:n}}} total]'.format(len(movies_per_day)),
+                               title='{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)),
+                               legend=True,
+                               framealpha=0.2))
+
+# Draw the figures above at the same time.  Figures that have not changed
+# since they were last drawn are skipped.
+hvrender.render(figures, group='hvorg_screenshots_analyze')
 
 # Figure 7
+figure = hvtrace.begin('figure 7')
 # Daily numbers as a plot
 title = 'daily screenshots requested'
 plt.close('all')
 fig = plt.figure(figsize=figsize)
 ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='D')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
-
-movies_per_day = np.asarray(list(h["movies"]))
-mean = np.int(np.rint(np.mean(movies_per_day)))
-median = np.int(np.rint(np.median(movies_per_day)))
 h.plot(kind='line', ax=ax)
 ax.axhline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
 ax.axhline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
@@ -176,24 +176,5 @@ plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
 filepath = os.path.join(img, filename)
-plt.savefig(filepath)
-
-
-# Figure 8
-# Distribution of the number of screenshots made per day
-title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
-plt.close('all')
-plt.hist(movies_per_day, bins=60, label='movies')
-plt.axvline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
-plt.axvline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
-plt.yscale('log')
-plt.xlabel('number of movies per day')
-plt.ylabel('number of days\n[{{{:n}}} total]'.format(len(movies_per_day)))
-plt.title('{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)))
-plt.grid('on', linestyle='dotted')
-plt.legend(framealpha=0.2)
-plt.tight_layout()
-filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
-filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+hvotex.savefig(filepath)
+figure.end()
@@ -4,128 +4,121 @@
 
 import os
 import pickle
-import json
-import numpy as np
-import pandas as pd
-from sunpy.time import parse_time, is_time
+
+import hvorg_time as hvot
+import hvorg_sources as hvsrc
+import hvorg_catalog as hvcat
+import hvorg_stream as hvstream
+import hvorg_logs as hvlog
+import hvorg_derived as hvod
+import hvorg_trace as hvtrace
 
 # The sources ids
 get_sources_ids = 'getDataSources.json'
 
 # Save the data
-save_directory = os.path.expanduser('~/Data/hvanalysis/derived')
+save_directory = hvod.directory
+
+# How to prepare the data.  'full' reads the logs into memory in one go,
+# 'streaming' reads them chunksize rows at a time so that memory use stays
+# flat however large the logs are.  'incremental' streams only the rows added
+# since the last streaming or incremental run, and appends them to the
+# derived data.  New rows are appended after all the rows prepared before,
+# so the rows of an incrementally prepared log are not in the same order as
+# after a full run.  A full run removes the watermark, so the next
+# incremental run prepares the whole log again rather than appending to the
+# outputs of the full run.
+# The pipeline passes its own settings in to the script, and these take the
+# place of the defaults here.
+prepare_mode = globals().get('prepare_mode', 'full')
+# prepare_mode = 'streaming'
+# prepare_mode = 'incremental'
+chunksize = globals().get('chunksize', hvstream.chunksize)
+
+# Number of worker processes used to parse the times
+workers = globals().get('workers', hvstream.workers)
 
 # Read in the data
 directory = os.path.expanduser('~/Data/hvanalysis/source')
 hvorg_screenshots = 'screenshots.csv'
 # hvorg_screenshots = 'screenshots_test.csv'
-f = os.path.join(directory, hvorg_screenshots)
-print('Loading ' + f)
-path = os.path.expanduser(f)
-df = pd.read_csv(path)
+path = os.path.expanduser(os.path.join(directory, hvorg_screenshots))
 
 hvorg_screenshots_legacy = 'screenshots_legacy.csv'
 # hvorg_screenshots_legacy = 'screenshots_test.csv'
-f = os.path.join(directory, hvorg_screenshots_legacy)
-print('Loading ' + f)
-path = os.path.expanduser(f)
-df_legacy = pd.read_csv(path)
-
-# Change the IDs of the legacy movies so they are unique
-df_legacy.loc[:, "id"] = df_legacy.loc[:, "id"] + 10**(1 + np.int(np.ceil(np.log10(len(df)))))
-
-# Append the legacy movies
-df = df.append(df_legacy, ignore_index=True)
-
-
-# Get some figures of merit for the screenshots
-def parse_timestamps(dtlist):
-    t = []
-    validity = []
-    for x in dtlist:
-        valid = is_time(x)
-        validity.append(valid)
-        if valid:
-            t.append(parse_time(x))
-        else:
-            t.append(-1)
-    return validity, t
-
-# When was the screenshot requested?
-print('Calculating screenshot request times')
-request_time_validity, request_time = parse_timestamps(df.timestamp.tolist())
-
-# What was the screenshot start time?
-print('Calculating screenshot observation time')
-observation_time_validity, obs_time = parse_timestamps(df.ObservationDate.tolist())
-
-# Calculate the time difference between the time of the request and the
-# screenshot time.  The start time is used since this is the only one that
-# can
-print('Calculating time difference between request time and observation time')
-n = len(request_time_validity)
-time_difference = []
-for i in range(0, n):
-    if request_time_validity[i] and observation_time_validity[i]:
-        time_difference.append([(request_time[i] - obs_time[i]).total_seconds()])
-request_time_validity = np.asarray(time_difference)
-
-f = os.path.join(save_directory, 'hvorg_screenshot_time_difference_seconds.npy')
-np.save(f, time_difference)
-
-f = os.path.join(save_directory, 'hvorg_screenshot_request_time.pkl')
-pickle.dump(request_time, open(f, 'wb'))
-
-f = os.path.join(save_directory, 'hvorg_screenshot_request_time_validity.pkl')
-pickle.dump(request_time_validity, open(f, 'wb'))
-
-f = os.path.join(save_directory, 'hvorg_screenshot_observation_time_validity.pkl')
-pickle.dump(observation_time_validity, open(f, 'wb'))
-
+path_legacy = os.path.expanduser(os.path.join(directory, hvorg_screenshots_legacy))
 
 # Analyze the Helioviewer getsourcesid return - map the sourceIds to the nicknames
-f = os.path.expanduser(os.path.join(directory, get_sources_ids))
-j = json.load(open(f, 'r'))
+catalog = hvcat.load(os.path.expanduser(os.path.join(directory, get_sources_ids)))
+source_ids_and_nicknames = catalog.source_ids_and_nicknames()
+f = os.path.join(save_directory, 'hvorg_screenshot_sourceids_and_nicknames.pkl')
+pickle.dump(source_ids_and_nicknames, open(f, 'wb'))
 
+all_sources = list(catalog.ids)
 
-def id_generator(dict_var):
-    for k, v in dict_var.items():
-        if k == "sourceId":
-            yield dict_var["sourceId"], dict_var["nickname"]
-        elif isinstance(v, dict):
-            for id_val in id_generator(v):
-                yield id_val
 
-source_ids_and_nicknames = list(id_generator(j))
-f = os.path.join(save_directory, 'hvorg_screenshot_sourceids_and_nicknames.pkl')
-pickle.dump(source_ids_and_nicknames, open(f, 'wb'))
+if prepare_mode in ('streaming', 'incremental'):
+    print('Calculating screenshot times and data sources')
+    all_sources = hvstream.prepare_screenshots([path, path_legacy], save_directory, 'hvorg',
+                                               catalog, all_sources, chunksize=chunksize,
+                                               incremental=prepare_mode == 'incremental',
+                                               workers=workers)
+else:
+    hvstream.remove_watermark(save_directory, 'hvorg_screenshot')
+
+    # Read the current and legacy screenshots as one log.  The ids of the
+    # legacy screenshots are moved out of the way of the current ones so they
+    # are unique.
+    log = hvlog.read([path, path_legacy])
+
+    # When was the screenshot requested?  Each time is parsed once, and the
+    # times that cannot be parsed are flagged as invalid.
+    print('Calculating screenshot request times')
+    n = len(log)
+    with hvtrace.stage('parse times', rows=n):
+        request_time, request_time_validity = hvot.parse_validated(log.column('timestamp'))
+
+        # What was the screenshot start time?
+        print('Calculating screenshot observation time')
+        obs_time, observation_time_validity = hvot.parse_validated(log.column('ObservationDate'))
+
+    # Calculate the time difference between the time of the request and the
+    # screenshot time, for the screenshots where both times are valid.  The
+    # start time is used since this is the only one that can
+    print('Calculating time difference between request time and observation time')
+    both = request_time_validity & observation_time_validity
+    time_difference = hvot.seconds(request_time[both] - obs_time[both])
+
+    with hvtrace.stage('save times'):
+        hvod.save('hvorg_screenshot_time_difference_seconds', time_difference, directory=save_directory)
+
+        hvod.save('hvorg_screenshot_request_time', request_time, directory=save_directory)
+
+        hvod.save('hvorg_screenshot_request_time_validity', request_time_validity, directory=save_directory)
 
-all_sources = [str(sian[0]) for sian in source_ids_and_nicknames]
+        hvod.save('hvorg_screenshot_observation_time_validity', observation_time_validity,
+                  directory=save_directory)
 
+    with hvtrace.stage('encode sources', rows=n):
+        source_codes, source_dictionary = hvsrc.encode(log.column('DataSourceID'))
+        hvsrc.save_encoded(save_directory, 'hvorg_screenshot_data_source_ids', source_codes, source_dictionary)
 
-# Create a new dataframe that explicitly holds which data source was used in each screenshot
-print('Creating a new dataframe that explicitly holds which data source was used in each screenshot')
-df_new = pd.DataFrame(0, index=df.index, columns=all_sources)
-df_new.index.name = 'screenshot number'
-for this_index in df.index:
-    source_id = df.loc[this_index, "DataSourceID"]
-    ids = source_id.split(',')
-    for id in ids:
-        df_new.loc[this_index, id] = 1
+    # Record which data source was used in each screenshot
+    print('Recording which data source was used in each screenshot')
+    with hvtrace.stage('incidence matrix', rows=n):
+        source_incidence, all_sources = hvsrc.encoded_incidence(source_codes, source_dictionary, sources=all_sources)
 
-# Change the column names to the easier to understand source nicknames
-df_new_column_names = list(df_new.columns.values)
-for df_new_column_name in df_new_column_names:
-    for source_id_and_nickname in source_ids_and_nicknames:
-        this_source_id = source_id_and_nickname[0]
-        this_nickname = source_id_and_nickname[1]
-        if df_new_column_name == str(this_source_id):
-            df_new.rename(columns={df_new_column_name: this_nickname}, inplace=True)
+    # Change the column names to the easier to understand source nicknames
+    source_nicknames = catalog.nicknames(all_sources)
 
+    # Save the source ID information
+    with hvtrace.stage('save incidence', rows=n):
+        f = os.path.join(save_directory, 'hvorg_screenshot_data_source_ids.csv')
+        hvsrc.write_incidence_csv(source_incidence, source_nicknames, f, index=log.index,
+                                  index_name='screenshot number')
 
-# Save the source ID information
-f = os.path.join(save_directory, 'hvorg_screenshot_data_source_ids.csv')
-df_new.to_csv(f)
+        f = os.path.join(save_directory, 'hvorg_screenshot_data_source_ids.npz')
+        hvsrc.save_incidence(f, source_incidence)
 
 # Save the data source IDs
 f = os.path.join(save_directory, 'hvorg_screenshot_data_source_ids.pkl')
@@ -0,0 +1,156 @@
+#
+# Which data sources were used in each request
+#
+import os
+import re
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Split every entry of a DataSourceID column in one pass.  'sep' is taken
+# literally.  Tokens have the whitespace around them removed, and missing
+# values and empty tokens give no tokens.  Returns the row each token came
+# from and the tokens themselves.
+def tokenize(values, sep=','):
+    s = pd.Series(values, dtype=object).reset_index(drop=True)
+    present = np.flatnonzero(s.notnull().values)
+    strings = s.iloc[present].astype(str)
+    if len(strings) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object)
+    counts = strings.str.count(re.escape(sep)).values + 1
+    rows = np.repeat(present, counts)
+    tokens = pd.Series(sep.join(strings.tolist()).split(sep), dtype=object).str.strip().values
+    keep = tokens != ''
+    return rows[keep], tokens[keep]
+
+
+# Dictionary encode a column of strings, such as DataSourceID or
+# DataSourceNames.  Each row gets an integer code, -1 where the value is
+# missing, that indexes the dictionary of unique values.  Values already in
+# 'dictionary' keep their codes and new values are appended to it in order of
+# first appearance.  Returns the codes and the dictionary.
+def encode(values, dictionary=None):
+    s = pd.Series(values, dtype=object).reset_index(drop=True)
+    present = s.notnull().values
+    codes = np.full(len(s), -1, dtype=np.int32)
+    present_codes, uniques = pd.factorize(s[present].astype(str).values)
+    dictionary = [] if dictionary is None else list(dictionary)
+    lookup = pd.Index(dictionary, dtype=object).get_indexer(uniques)
+    new = lookup < 0
+    lookup[new] = len(dictionary) + np.arange(np.count_nonzero(new))
+    dictionary += [str(u) for u in uniques[new]]
+    codes[present] = lookup[present_codes]
+    return codes, dictionary
+
+
+# How many rows use each entry of the dictionary
+def counts(codes, dictionary):
+    return np.bincount(codes[codes >= 0], minlength=len(dictionary))
+
+
+# The unique tokens of a dictionary of separated values, in order of first
+# appearance, split as tokenize does
+def unique_tokens(dictionary, sep=','):
+    rows, tokens = tokenize(dictionary, sep=sep)
+    return list(OrderedDict.fromkeys(tokens))
+
+
+# Build a CSR incidence matrix with one row per request and one column per
+# data source.  An element is 1 if the data source was used in that request.
+# The columns follow the order of 'sources' if given, followed by the sources
+# in order of first appearance.  Only the unique combinations of sources are
+# split up; the rows are then picked out of their incidence by code.  Rows
+# with a missing value use no data source.  Returns the matrix and the column
+# sources.
+def incidence_matrix(values, sources=None, sep=','):
+    codes, dictionary = encode(values)
+    return encoded_incidence(codes, dictionary, sources=sources, sep=sep)
+
+
+# The incidence matrix of a dictionary encoded column, as made by encode.
+# Returns the matrix and the column sources.
+def encoded_incidence(codes, dictionary, sources=None, sep=','):
+    m, sources = dictionary_incidence(dictionary, sources=sources, sep=sep)
+    # Missing values have code -1, which picks out an empty last row
+    m = sparse.vstack([m, sparse.csr_matrix((1, m.shape[1]), dtype=m.dtype)], format='csr')
+    return m[codes], sources
+
+
+# The incidence matrix of a dictionary of combinations of sources, one row
+# per combination
+def dictionary_incidence(dictionary, sources=None, sep=','):
+    rows, tokens = tokenize(dictionary, sep=sep)
+    if sources is None:
+        cols, uniques = pd.factorize(tokens)
+        sources = [str(x) for x in uniques]
+    else:
+        sources = [str(x) for x in sources]
+        cols = pd.Index(sources).get_indexer(tokens)
+        unknown = cols < 0
+        if np.any(unknown):
+            extra_cols, extra = pd.factorize(tokens[unknown])
+            cols[unknown] = extra_cols + len(sources)
+            sources = sources + [str(x) for x in extra]
+
+    m = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                          shape=(len(dictionary), len(sources)))
+    # A source listed twice in the same request still counts once
+    m.data[:] = 1
+    return m, sources
+
+
+# Which rows used a data source, worked out from the codes of the rows
+def uses_source(codes, dictionary, source, sep=','):
+    m, sources = dictionary_incidence(dictionary, sep=sep)
+    if str(source) not in sources:
+        return np.zeros(len(codes), dtype=bool)
+    using = np.flatnonzero(m[:, sources.index(str(source))].toarray().ravel())
+    return np.isin(codes, using)
+
+
+# Write the incidence matrix in the same dense CSV layout the prepare scripts
+# have always written.  Rows are written in blocks so that the full dense
+# table never exists in memory.
+def write_incidence_csv(m, columns, path, index=None, index_name='movie number', chunksize=100000, mode='w'):
+    nrows = m.shape[0]
+    index = np.arange(nrows) if index is None else np.asarray(index)
+    header = mode == 'w'
+    for start in range(0, max(nrows, 1), chunksize):
+        stop = min(start + chunksize, nrows)
+        block = pd.DataFrame(m[start:stop].toarray(), index=index[start:stop], columns=columns)
+        block.index.name = index_name
+        block.to_csv(path, mode=mode, header=header)
+        mode = 'a'
+        header = False
+
+
+# Save and load the incidence matrix in its compact sparse form
+def save_incidence(path, m):
+    sparse.save_npz(path, m)
+
+
+def load_incidence(path):
+    return sparse.load_npz(path).tocsr()
+
+
+# Save and load a dictionary encoded column as '<name>_codes.npy' and
+# '<name>_dictionary.json'.  The codes are memory-mapped when loaded.
+def save_encoded(directory, name, codes, dictionary):
+    np.save(os.path.join(directory, '{:s}_codes.npy'.format(name)), np.asarray(codes, dtype=np.int32))
+    save_dictionary(directory, name, dictionary)
+
+
+def save_dictionary(directory, name, dictionary):
+    json.dump(dictionary, open(os.path.join(directory, '{:s}_dictionary.json'.format(name)), 'w'))
+
+
+def load_dictionary(directory, name):
+    return json.load(open(os.path.join(directory, '{:s}_dictionary.json'.format(name)), 'r'))
+
+
+def load_encoded(directory, name, mmap_mode='r'):
+    codes = np.load(os.path.join(directory, '{:s}_codes.npy'.format(name)), mmap_mode=mmap_mode)
+    return codes, load_dictionary(directory, name)
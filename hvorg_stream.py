@@ -0,0 +1,363 @@
+#
+# Streaming preparation of the request logs.  The logs are read a fixed number
+# of rows at a time and the derived quantities are appended to the outputs
+# chunk by chunk, so that memory use does not grow with the size of the log.
+#
+# Each run leaves a watermark next to the outputs recording how much of each
+# log has been prepared.  An incremental run reads the watermark, prepares only
+# the rows added since, and appends them to the existing outputs.  The new rows
+# of every segment of the log go after all the rows prepared before, so after
+# an incremental run new current log rows follow the legacy log rows, where a
+# full run puts all the current log rows first.
+#
+import os
+import json
+import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import hvorg_time as hvot
+import hvorg_sources as hvsrc
+import hvorg_trace as hvtrace
+
+# Number of rows read from a CSV file at a time
+chunksize = 250000
+
+# Number of worker processes used to parse the chunks
+workers = 1
+
+
+# The names the marks of the segments of a log are kept under: the current
+# log, then the legacy log, then any segments added after those.  The marks
+# follow the role of a segment rather than its file name, so that a nightly
+# export saved under a new date stamped name is still read from where the
+# last run stopped.
+def segment_names(n):
+    names = ['current', 'legacy']
+    return (names + ['segment {:d}'.format(i) for i in range(len(names), n)])[:n]
+
+
+# Read the rows of a sequence of CSV files that have not been prepared yet.
+# 'marks' records, for each segment of the log, the number of rows and the
+# largest id seen so far, and is updated as the files are read.  Rows with an
+# id no larger than the recorded one are skipped, or if the file has no id
+# column, the rows already counted.  Files whose size and modification time
+# have not changed are not read at all.  Each chunk is indexed by its row
+# number, counted continuously across all the files from first_row.  Yields
+# the mark of the file each chunk came from, and the chunk.
+def read_csv_chunks(paths, chunksize=chunksize, first_row=0, marks=None):
+    marks = {} if marks is None else marks
+    row = first_row
+    for segment, path in zip(segment_names(len(paths)), paths):
+        # Watermarks written before the marks were kept by segment are keyed
+        # by file name
+        if segment not in marks and os.path.basename(path) in marks:
+            marks[segment] = marks.pop(os.path.basename(path))
+        mark = marks.setdefault(segment, {'rows': 0})
+        stat = os.stat(path)
+        if mark.get('size') == stat.st_size and mark.get('mtime') == stat.st_mtime:
+            continue
+        mark['file'] = os.path.basename(path)
+
+        print('Loading ' + path)
+        last_id = mark.get('id')
+        seen = 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            n = len(chunk)
+            if 'id' in chunk.columns and last_id is not None:
+                chunk = chunk[chunk.id.values > last_id]
+            else:
+                chunk = chunk.iloc[max(0, mark['rows'] - seen):]
+            seen += n
+            if len(chunk) == 0:
+                continue
+            chunk.index = pd.RangeIndex(row, row + len(chunk))
+            row += len(chunk)
+            if 'id' in chunk.columns:
+                mark['id'] = max(mark.get('id', int(chunk.id.min())), int(chunk.id.max()))
+            yield mark, chunk
+
+        mark['rows'] = max(mark['rows'], seen)
+        mark['size'] = stat.st_size
+        mark['mtime'] = stat.st_mtime
+
+
+# Apply 'derive' to each (mark, chunk) pair, in a pool of worker processes if
+# workers > 1.  No more than two chunks per worker are in flight at once, so
+# memory use stays bounded.  Yields the mark, the chunk and what was derived
+# from it, in the order the chunks were read.
+def derive_chunks(derive, chunks, workers=workers):
+    if workers <= 1:
+        for mark, chunk in chunks:
+            yield mark, chunk, derive(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for mark, chunk in chunks:
+            pending.append((mark, chunk, executor.submit(derive, chunk)))
+            if len(pending) >= 2 * workers:
+                mark, chunk, future = pending.popleft()
+                yield mark, chunk, future.result()
+        while pending:
+            mark, chunk, future = pending.popleft()
+            yield mark, chunk, future.result()
+
+
+# Apply 'derive' to a whole data frame, split into pieces of chunksize rows
+# that are shared out between the workers.  The frame can also be a
+# hvorg_logs.SegmentedLog.  The derived arrays of the pieces are joined back
+# together.
+def derive_frame(derive, df, workers=workers, chunksize=chunksize):
+    if hasattr(df, 'chunks'):
+        pieces = ((None, chunk) for chunk in df.chunks(chunksize))
+    else:
+        pieces = ((None, df.iloc[start:start + chunksize]) for start in range(0, len(df), chunksize))
+    derived = OrderedDict()
+    with hvtrace.stage('derive {:s}'.format(derive.__name__), rows=len(df), workers=workers):
+        for mark, chunk, values in derive_chunks(derive, pieces, workers=workers):
+            for key, value in values.items():
+                derived.setdefault(key, []).append(value)
+        return OrderedDict((key, np.concatenate(value)) for key, value in derived.items())
+
+
+# Write a one dimensional .npy file a block at a time.  Space for the header is
+# reserved when the file is opened, and the header is filled in with the final
+# length when the file is closed.  With append=True an existing .npy file is
+# extended instead, after the rows counted in its header; any rows written
+# after that by an interrupted run are cut off.
+class NpyAppender(object):
+    header_size = 128
+
+    def __init__(self, path, dtype=None, append=False):
+        self.path = path
+        if append and os.path.exists(path):
+            self.f = open(path, 'r+b')
+            if np.lib.format.read_magic(self.f) != (1, 0):
+                raise ValueError('Can only append to version 1.0 .npy files: ' + path)
+            shape, fortran_order, self.dtype = np.lib.format.read_array_header_1_0(self.f)
+            self.header_size = self.f.tell()
+            self.n = shape[0]
+            self.shape_tail = shape[1:]
+            self.f.seek(self.header_size + self.n * int(np.prod(self.shape_tail)) * self.dtype.itemsize)
+            self.f.truncate()
+        else:
+            self.dtype = np.dtype(dtype)
+            self.n = 0
+            self.shape_tail = ()
+            self.f = open(path, 'wb')
+            self.f.write(b' ' * self.header_size)
+
+    def append(self, a):
+        a = np.ascontiguousarray(a, dtype=self.dtype).reshape((-1,) + self.shape_tail)
+        self.f.write(a.tobytes())
+        self.n += len(a)
+
+    # Move the data along to make room for a longer header
+    def grow_header(self, header_size):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as out:
+            out.write(b' ' * header_size)
+            self.f.seek(self.header_size)
+            shutil.copyfileobj(self.f, out)
+        self.f.close()
+        os.rename(tmp, self.path)
+        self.f = open(self.path, 'r+b')
+        self.header_size = header_size
+
+    def close(self):
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".format(
+            np.lib.format.dtype_to_descr(self.dtype), (self.n,) + tuple(self.shape_tail))
+        if len(header) + 11 > self.header_size:
+            self.grow_header(64 * ((len(header) + 11) // 64 + 1))
+        header = header.ljust(self.header_size - 11) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00')
+        self.f.write(np.uint16(len(header)).astype('<u2').tobytes())
+        self.f.write(header.encode('latin1'))
+        self.f.close()
+
+
+# Accumulate the data source incidence of a log a chunk at a time.  The
+# (row, source) pairs are spilled to disk as they are found and only turned
+# into a sparse matrix at the end.  Row numbers start at first_row.  Each chunk
+# is appended dictionary encoded, as made by hvorg_sources.encode.
+class IncidenceAppender(object):
+    def __init__(self, path, sources=None, first_row=0):
+        self.path = path
+        self.sources = [] if sources is None else [str(s) for s in sources]
+        self.rows = NpyAppender(path + '.rows.npy', np.int64)
+        self.cols = NpyAppender(path + '.cols.npy', np.int32)
+        self.first_row = first_row
+        self.nrows = first_row
+
+    def append(self, codes, dictionary, first_row):
+        m, self.sources = hvsrc.encoded_incidence(codes, dictionary, sources=self.sources)
+        coo = m.tocoo()
+        self.rows.append(coo.row + first_row)
+        self.cols.append(coo.col)
+        self.nrows = first_row + m.shape[0]
+
+    # Returns the CSR incidence matrix of the rows appended and the sources of
+    # its columns
+    def close(self):
+        self.rows.close()
+        self.cols.close()
+        rows = np.load(self.rows.path, mmap_mode='r')
+        cols = np.load(self.cols.path)
+        indptr = np.searchsorted(rows, np.arange(self.first_row, self.nrows + 1))
+        m = sparse.csr_matrix((np.ones(len(cols), dtype=np.int8), cols, indptr),
+                              shape=(self.nrows - self.first_row, len(self.sources)))
+        del rows
+        os.remove(self.rows.path)
+        os.remove(self.cols.path)
+        return m, self.sources
+
+
+# Save the incidence matrix as a dense CSV and in its sparse form
+def save_incidence(m, sources, catalog, save_directory, name, index_name):
+    f = os.path.join(save_directory, '{:s}.csv'.format(name))
+    hvsrc.write_incidence_csv(m, catalog.nicknames(sources), f, index_name=index_name)
+    f = os.path.join(save_directory, '{:s}.npz'.format(name))
+    hvsrc.save_incidence(f, m)
+
+
+# Append the incidence of newly prepared rows to the saved incidence.  The
+# dense CSV is only rewritten if new data sources have appeared.
+def append_incidence(m, sources, catalog, save_directory, name, index_name, first_row):
+    f = os.path.join(save_directory, '{:s}.npz'.format(name))
+    old = hvsrc.load_incidence(f)
+    new_sources = old.shape[1] < len(sources)
+    old = sparse.csr_matrix((old.data, old.indices, old.indptr), shape=(old.shape[0], len(sources)))
+    m_all = sparse.vstack([old, m], format='csr')
+    hvsrc.save_incidence(f, m_all)
+
+    f = os.path.join(save_directory, '{:s}.csv'.format(name))
+    columns = catalog.nicknames(sources)
+    if not new_sources:
+        hvsrc.write_incidence_csv(m, columns, f, index=np.arange(first_row, first_row + m.shape[0]),
+                                  index_name=index_name, mode='a')
+    else:
+        hvsrc.write_incidence_csv(m_all, columns, f, index_name=index_name)
+
+
+# Where the watermark of a prepared log is kept
+def watermark_path(save_directory, name):
+    return os.path.join(save_directory, '{:s}_watermark.json'.format(name))
+
+
+# Forget how much of a log has been prepared.  Used when the outputs are
+# written by other means, so that an incremental run does not append to them
+# from an out of date watermark but prepares the whole log again.
+def remove_watermark(save_directory, name):
+    f = watermark_path(save_directory, name)
+    if os.path.exists(f):
+        os.remove(f)
+
+
+def load_watermark(save_directory, name):
+    f = watermark_path(save_directory, name)
+    if not os.path.exists(f):
+        return None
+    return json.load(open(f, 'r'))
+
+
+def save_watermark(save_directory, name, watermark):
+    json.dump(watermark, open(watermark_path(save_directory, name), 'w'), indent=1)
+
+
+# Streaming preparation of a log.  'derive' turns a chunk of the log into an
+# ordered dictionary of derived arrays, and each one is appended to the file
+# '<name>_<key>.npy'.  The data source incidence is saved as incidence_name,
+# with its columns named by the nicknames in the data source catalog.  The
+# DataSourceID and DataSourceNames columns are also saved dictionary encoded.
+# If incremental is True and an earlier run left a watermark, only the rows
+# added since are prepared and appended to the existing outputs.  Returns the
+# data source ids and names found in the log.
+def prepare_log(paths, save_directory, name, derive, incidence_name, index_name, catalog,
+                sources=None, chunksize=chunksize, incremental=False, workers=workers):
+    watermark = load_watermark(save_directory, name) if incremental else None
+    append = watermark is not None
+    if not append:
+        watermark = {'rows': 0,
+                     'files': {},
+                     'sources': [] if sources is None else [str(s) for s in sources],
+                     'data_source_names': []}
+    first_row = watermark['rows']
+    prepare = hvtrace.begin('prepare {:s}'.format(name), incremental=append)
+
+    outputs = OrderedDict()
+    incidence = IncidenceAppender(os.path.join(save_directory, incidence_name),
+                                  sources=watermark['sources'], first_row=first_row)
+    encoded = (('DataSourceID', incidence_name), ('DataSourceNames', incidence_name.replace('_ids', '_names')))
+    dictionaries = OrderedDict()
+    for column, encoded_name in encoded:
+        f = os.path.join(save_directory, '{:s}_codes.npy'.format(encoded_name))
+        if append and os.path.exists(f):
+            dictionaries[column] = hvsrc.load_dictionary(save_directory, encoded_name)
+            outputs[column] = NpyAppender(f, np.int32, append=True)
+    chunks = read_csv_chunks(paths, chunksize=chunksize, first_row=first_row, marks=watermark['files'])
+    for mark, chunk, derived in derive_chunks(derive, chunks, workers=workers):
+        prepare.count(len(chunk))
+        for key, value in derived.items():
+            if key not in outputs:
+                f = os.path.join(save_directory, '{:s}_{:s}.npy'.format(name, key))
+                outputs[key] = NpyAppender(f, value.dtype, append=append)
+            outputs[key].append(value)
+        for column, encoded_name in encoded:
+            if column in chunk.columns:
+                codes, dictionaries[column] = hvsrc.encode(chunk[column], dictionaries.get(column))
+                if column not in outputs:
+                    f = os.path.join(save_directory, '{:s}_codes.npy'.format(encoded_name))
+                    outputs[column] = NpyAppender(f, np.int32)
+                outputs[column].append(codes)
+                if column == 'DataSourceID':
+                    incidence.append(codes, dictionaries[column], chunk.index[0])
+        request_time = derived['request_time'][~np.isnat(derived['request_time'])]
+        if len(request_time) > 0:
+            mark['timestamp'] = max(mark.get('timestamp', ''), str(request_time.max()))
+
+    for output in outputs.values():
+        output.close()
+    for column, encoded_name in encoded:
+        if column in dictionaries:
+            hvsrc.save_dictionary(save_directory, encoded_name, dictionaries[column])
+    with hvtrace.stage('save incidence', rows=incidence.nrows - first_row):
+        m, all_sources = incidence.close()
+        if append:
+            append_incidence(m, all_sources, catalog, save_directory, incidence_name, index_name,
+                             first_row)
+        else:
+            save_incidence(m, all_sources, catalog, save_directory, incidence_name, index_name)
+
+    watermark['rows'] = incidence.nrows
+    watermark['sources'] = all_sources
+    if 'DataSourceNames' in dictionaries:
+        watermark['data_source_names'] = hvsrc.unique_tokens(dictionaries['DataSourceNames'], sep=' , ')
+    save_watermark(save_directory, name, watermark)
+    prepare.end()
+    return watermark['sources'], watermark['data_source_names']
+
+
+# Streaming preparation of a movie log.  The outputs are the same typed .npy
+# files written by the full preparation.  Returns the data source ids and names
+# found in the log.
+def prepare_movies(paths, save_directory, prefix, catalog, chunksize=chunksize, incremental=False,
+                   workers=workers):
+    return prepare_log(paths, save_directory, '{:s}_movie'.format(prefix), hvot.movie_times,
+                       '{:s}_data_source_ids'.format(prefix), 'movie number', catalog,
+                       chunksize=chunksize, incremental=incremental, workers=workers)
+
+
+# Streaming preparation of a screenshot log.  Every screenshot is checked
+# against the known data sources 'all_sources'.  Returns the data source
+# ids found in the log.
+def prepare_screenshots(paths, save_directory, prefix, catalog, all_sources, chunksize=chunksize,
+                        incremental=False, workers=workers):
+    return prepare_log(paths, save_directory, '{:s}_screenshot'.format(prefix), hvot.screenshot_times,
+                       '{:s}_screenshot_data_source_ids'.format(prefix), 'screenshot number',
+                       catalog, sources=all_sources, chunksize=chunksize,
+                       incremental=incremental, workers=workers)[0]
@@ -33,7 +33,7 @@ durations = {"tmduration": ["$t_{duration}$", "requested duration"],
 
 # Quantities
 quantity = {"hvm": "$n_{hv}$", "jhvm": "$n_{jhv}$",
-            "hve": "$m_{hv}$"}
+            "hve": "$m_{hv}$", "hvs": "$s_{hv}$"}
 
 
 # Helioviewer Project Dates
@@ -0,0 +1,551 @@
+#
+# Synthetic Helioviewer and JHelioviewer request logs, written in the same
+# CSV schemas as the real logs read by the prepare scripts, together with a
+# getDataSources.json describing the data sources they use.
+#
+# Each log is made from a model of the requests: the daily request rate over
+# the years with its weekly cycle, the time of day of the requests, bursts of
+# requests after the events in hvos.solar_physics_events, the mix of real time
+# and archival requests with their heavy tailed topicality, the movie
+# durations and the combinations of data sources requested.  fit() builds the
+# models from the derived data of the real logs, so that logs many times the
+# size of the real ones can be made with the same structure.  Without derived
+# data, default models are used.
+#
+# All the columns are sampled with numpy and the rows formatted as bytes in
+# one vectorized pass per block of days, so logs of 100 million rows take
+# minutes.
+#
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+import hvorg_style as hvos
+import hvorg_derived as hvod
+import hvorg_sources as hvsrc
+import hvorg_catalog as hvcat
+import hvorg_counts as hvcount
+
+# Random seed
+seed = 1
+
+# Time range of the requests of the default models
+start = '2011-06-01'
+end = '2017-11-28'
+
+# Nothing is asked for from before the first data in Helioviewer
+earliest = '1991-09-01'
+
+# Requests made before this time are written to the legacy log of the logs
+# that have one
+legacy_end = hvos.hv_project_dates['bigbreak']['date_start']
+
+# Rows written at a time, roughly.  Blocks are whole days.
+chunksize = 1000000
+
+# Requests for data ending less than this many seconds before the request are
+# real time requests, the others are archival
+real_time_limit = 86400.0
+
+# Days over which the daily request rate is smoothed to find the trend
+trend_days = 28
+
+# The extra requests after an event fall off by a factor e every burst_days,
+# and stop after burst_window days
+burst_days = 2.0
+burst_window = 10
+
+# Most combinations of data sources kept in a fitted model
+max_combinations = 1000
+
+# Where the fitted models are kept
+model_file = os.path.join(hvod.directory, 'synthetic_models.json')
+
+# The data sources of the default models: id, nickname and the keys leading
+# to the data source in getDataSources.json
+data_sources = [(0, 'EIT 171', ('SOHO', 'EIT', 'EIT', '171')),
+                (1, 'EIT 195', ('SOHO', 'EIT', 'EIT', '195')),
+                (2, 'EIT 284', ('SOHO', 'EIT', 'EIT', '284')),
+                (3, 'EIT 304', ('SOHO', 'EIT', 'EIT', '304')),
+                (4, 'LASCO C2', ('SOHO', 'LASCO', 'C2', 'white-light')),
+                (5, 'LASCO C3', ('SOHO', 'LASCO', 'C3', 'white-light')),
+                (6, 'MDI Mag', ('SOHO', 'MDI', 'MDI', 'magnetogram')),
+                (7, 'MDI Int', ('SOHO', 'MDI', 'MDI', 'continuum')),
+                (8, 'AIA 94', ('SDO', 'AIA', 'AIA', '94')),
+                (9, 'AIA 131', ('SDO', 'AIA', 'AIA', '131')),
+                (10, 'AIA 171', ('SDO', 'AIA', 'AIA', '171')),
+                (11, 'AIA 193', ('SDO', 'AIA', 'AIA', '193')),
+                (12, 'AIA 211', ('SDO', 'AIA', 'AIA', '211')),
+                (13, 'AIA 304', ('SDO', 'AIA', 'AIA', '304')),
+                (14, 'AIA 335', ('SDO', 'AIA', 'AIA', '335')),
+                (15, 'AIA 1600', ('SDO', 'AIA', 'AIA', '1600')),
+                (16, 'AIA 1700', ('SDO', 'AIA', 'AIA', '1700')),
+                (17, 'AIA 4500', ('SDO', 'AIA', 'AIA', '4500')),
+                (18, 'HMI Int', ('SDO', 'HMI', 'HMI', 'continuum')),
+                (19, 'HMI Mag', ('SDO', 'HMI', 'HMI', 'magnetogram')),
+                (20, 'EUVI-A 171', ('STEREO_A', 'SECCHI', 'EUVI', '171')),
+                (21, 'EUVI-A 195', ('STEREO_A', 'SECCHI', 'EUVI', '195')),
+                (22, 'EUVI-A 284', ('STEREO_A', 'SECCHI', 'EUVI', '284')),
+                (23, 'EUVI-A 304', ('STEREO_A', 'SECCHI', 'EUVI', '304')),
+                (28, 'COR1-A', ('STEREO_A', 'SECCHI', 'COR1', 'white-light')),
+                (29, 'COR2-A', ('STEREO_A', 'SECCHI', 'COR2', 'white-light')),
+                (32, 'SWAP 174', ('PROBA2', 'SWAP', 'SWAP', '174'))]
+
+# The logs: the file each is written to and the file its legacy requests are
+# written to, if it has one, named as the prepare scripts read them, its
+# default number of rows, the service its derived data was saved under, what
+# kind of requests it records and the derived data source codes, if it
+# records data sources
+logs = OrderedDict([('movies', {'file': 'movies_20171128.csv', 'legacy': 'movies_legacy.csv', 'rows': 1000000,
+                                'service': 'hvorg_movie', 'kind': 'movie', 'sources': 'hvorg_data_source_ids'}),
+                    ('screenshots', {'file': 'screenshots.csv', 'legacy': 'screenshots_legacy.csv', 'rows': 1000000,
+                                     'service': 'hvorg_screenshot', 'kind': 'screenshot',
+                                     'sources': 'hvorg_screenshot_data_source_ids'}),
+                    ('embed', {'file': 'embed.csv', 'legacy': None, 'rows': 1000000, 'service': 'hvorg_embed',
+                               'kind': 'request', 'sources': None}),
+                    ('jpx', {'file': 'jpx.csv', 'legacy': None, 'rows': 100000, 'service': 'jhv_movie',
+                             'kind': 'movie', 'sources': 'jhv_data_source_ids'}),
+                    ('jhv_request_statistics', {'file': 'jhv_request_statistics.csv', 'legacy': None, 'rows': 100000,
+                                                'service': 'jhv_movie', 'kind': 'request', 'sources': None})])
+
+# The columns of each kind of log, in the order the real logs have them
+columns = {'movie': ('id', 'timestamp', 'StartDate', 'EndDate', 'DataSourceID', 'DataSourceNames'),
+           'screenshot': ('id', 'timestamp', 'ObservationDate', 'DataSourceID'),
+           'request': ('id', 'timestamp')}
+
+
+# getDataSources.json for a list of data sources
+def get_data_sources(sources=data_sources):
+    d = OrderedDict()
+    for source_id, nickname, path in sources:
+        level = d
+        for key in path:
+            level = level.setdefault(key, OrderedDict())
+        level['sourceId'] = source_id
+        level['nickname'] = nickname
+    return d
+
+
+# Day number, from the epoch, of a date
+def day_number(date):
+    return int(np.datetime64(pd.Timestamp(date), 'D').astype(np.int64))
+
+
+# Model fitting
+
+# Mean and standard deviation of the logarithm of the positive values
+def fit_lognormal(values, default=(0.0, 1.0)):
+    values = values[values > 0]
+    if len(values) < 2:
+        return [float(default[0]), float(default[1])]
+    logs = np.log(values)
+    return [float(np.mean(logs)), float(max(np.std(logs), 1e-3))]
+
+
+# A model of the time between a request and the data it asks for, in seconds:
+# the fraction of requests for data after the request, for real time data and
+# for archival data, and a log-normal distribution for each
+def fit_lag(seconds):
+    s = np.asarray(seconds, dtype=np.float64)
+    s = s[np.isfinite(s)]
+    if len(s) == 0:
+        return default_lag()
+    negative = s < 0
+    real_time = (s >= 0) & (s < real_time_limit)
+    archival = s >= real_time_limit
+    return OrderedDict([('fractions', [float(np.mean(negative)), float(np.mean(real_time)), float(np.mean(archival))]),
+                        ('negative', fit_lognormal(-s[negative], default=(np.log(3600.0), 1.0))),
+                        ('real_time', fit_lognormal(s[real_time], default=(np.log(3 * 3600.0), 1.5))),
+                        ('archival', fit_lognormal(s[archival], default=(np.log(200 * 86400.0), 2.0)))])
+
+
+# Smooth daily counts over trend_days, allowing for the ends
+def smooth(counts, days=trend_days):
+    kernel = np.ones(days)
+    total = np.convolve(counts, kernel, mode='same')
+    n = np.convolve(np.ones(len(counts)), kernel, mode='same')
+    return total / n
+
+
+# Day of the week of day numbers, Monday is 0
+def weekday(days):
+    return (np.asarray(days) + 3) % 7
+
+
+# A model of when requests are made: the daily request rate relative to its
+# mean (the trend), the weekly cycle, the time of day, and the size of the
+# burst of requests after each event, relative to the usual daily rate
+def fit_times(t):
+    t = np.asarray(t).astype('datetime64[s]')
+    t = t[~np.isnat(t)]
+    if len(t) == 0:
+        return default_times()
+    c = hvcount.time_counts(t, 'D')
+    counts = c.values.astype(np.float64)
+    first = day_number(c.index[0])
+    days = np.arange(first, first + len(counts))
+
+    trend = smooth(counts)
+    ratio = np.where(trend > 0, counts / np.where(trend > 0, trend, 1), np.nan)
+    week = np.array([np.nanmean(ratio[weekday(days) == k]) if np.any(weekday(days) == k) else 1.0 for k in range(7)])
+    week = np.where(np.isfinite(week), week, 1.0)
+    week = week / np.mean(week)
+
+    hours = (t - t.astype('datetime64[D]')).astype(np.int64) // 3600
+    hour = np.bincount(hours, minlength=24)[:24].astype(np.float64)
+
+    expected = trend * week[weekday(days)]
+    bursts = OrderedDict()
+    for event in sorted(hvos.solar_physics_events):
+        d = day_number(hvos.solar_physics_events[event]['date']) - first
+        if 0 <= d < len(counts) and expected[d] > 0:
+            bursts[event] = float(max(0.0, counts[d] / expected[d] - 1))
+
+    return OrderedDict([('start', str(c.index[0].date())),
+                        ('end', str(c.index[-1].date())),
+                        ('trend', list(trend / np.mean(trend))),
+                        ('weekday', list(week)),
+                        ('hour', list(hour / np.sum(hour))),
+                        ('bursts', bursts)])
+
+
+# A model of the combinations of data sources requested: the most common
+# combinations and how often each is requested
+def fit_sources(codes, dictionary):
+    codes = np.asarray(codes)
+    counts = np.bincount(codes[codes >= 0], minlength=len(dictionary)).astype(np.float64)
+    keep = np.argsort(counts, kind='stable')[::-1][:max_combinations]
+    keep = keep[counts[keep] > 0]
+    if len(keep) == 0:
+        return default_sources()
+    return OrderedDict([('combinations', [dictionary[i] for i in keep]),
+                        ('weights', list(counts[keep] / np.sum(counts[keep])))])
+
+
+# Fit the model of one log to the derived data of the real log.  Parts of the
+# model whose derived data is missing are the defaults.
+def fit_log(log, directory=hvod.directory):
+    service = logs[log]['service']
+    kind = logs[log]['kind']
+    model = default_model(log)
+
+    def exists(name):
+        return os.path.exists(os.path.join(directory, '{:s}.npy'.format(name)))
+
+    times = '{:s}_request_time'.format(service) if kind != 'request' else '{:s}_request_timestamps_only'.format(service)
+    if exists(times):
+        t = hvod.load(times, directory=directory)
+        model['rows'] = len(t)
+        model.update(fit_times(t))
+    if kind == 'movie':
+        if exists('{:s}_topicality_seconds'.format(service)):
+            model['lag'] = fit_lag(hvod.load('{:s}_topicality_seconds'.format(service), directory=directory))
+        if exists('{:s}_durations_seconds'.format(service)):
+            d = np.asarray(hvod.load('{:s}_durations_seconds'.format(service), directory=directory), dtype=np.float64)
+            model['duration'] = fit_lognormal(d[np.isfinite(d)], default=model['duration'])
+    if kind == 'screenshot' and exists('{:s}_time_difference_seconds'.format(service)):
+        model['lag'] = fit_lag(hvod.load('{:s}_time_difference_seconds'.format(service), directory=directory))
+    if logs[log]['sources'] is not None and exists('{:s}_codes'.format(logs[log]['sources'])):
+        model['sources'] = fit_sources(*hvsrc.load_encoded(directory, logs[log]['sources']))
+    return model
+
+
+# Fit the models of all the logs to the derived data.  The data sources are
+# those of the catalog of the real getDataSources.json, if it has been built.
+def fit(directory=hvod.directory, catalog_file=hvcat.catalog_file):
+    models = OrderedDict()
+    if os.path.exists(catalog_file):
+        entries = json.load(open(catalog_file, 'r'))['entries']
+        models['data_sources'] = [[int(sid) if sid.isdigit() else sid, nickname, list(path)]
+                                  for sid, nickname, path in entries]
+    else:
+        models['data_sources'] = [[sid, nickname, list(path)] for sid, nickname, path in data_sources]
+    models['logs'] = OrderedDict((log, fit_log(log, directory=directory)) for log in logs)
+    return models
+
+
+def save_models(models, path=model_file):
+    json.dump(models, open(path, 'w'), indent=1)
+
+
+def load_models(path=model_file):
+    return json.load(open(path, 'r'), object_pairs_hook=OrderedDict)
+
+
+# Default models
+
+def default_lag():
+    return OrderedDict([('fractions', [0.01, 0.6, 0.39]),
+                        ('negative', [float(np.log(3600.0)), 1.0]),
+                        ('real_time', [float(np.log(3 * 3600.0)), 1.5]),
+                        ('archival', [float(np.log(200 * 86400.0)), 2.0])])
+
+
+def default_times():
+    ndays = day_number(end) - day_number(start) + 1
+    hours = np.arange(24)
+    hour = 1 + 0.5 * np.cos(2 * np.pi * (hours - 15) / 24.0)
+    week = np.array([1.1, 1.1, 1.1, 1.05, 1.0, 0.8, 0.75])
+    bursts = OrderedDict((event, 3.0) for event in sorted(hvos.solar_physics_events)
+                         if day_number(start) <= day_number(hvos.solar_physics_events[event]['date']) <= day_number(end))
+    return OrderedDict([('start', start),
+                        ('end', end),
+                        ('trend', [1.0] * ndays),
+                        ('weekday', list(week / np.mean(week))),
+                        ('hour', list(hour / np.sum(hour))),
+                        ('bursts', bursts)])
+
+
+# Combinations of one to three of the default data sources, the most common
+# requested far more often than the rest
+def default_sources(sources=data_sources, combinations=200):
+    rng = np.random.default_rng(seed)
+    ids = np.array([str(source[0]) for source in sources], dtype=object)
+    found = OrderedDict()
+    while len(found) < min(combinations, len(sources)):
+        found[','.join(ids[rng.choice(len(sources), size=rng.integers(1, 4), replace=False)])] = True
+    weights = 1.0 / np.arange(1, len(found) + 1) ** 1.1
+    return OrderedDict([('combinations', list(found.keys())),
+                        ('weights', list(weights / np.sum(weights)))])
+
+
+def default_model(log):
+    model = OrderedDict([('rows', logs[log]['rows'])])
+    model.update(default_times())
+    model['lag'] = default_lag()
+    model['duration'] = [float(np.log(86400.0)), 1.5]
+    if logs[log]['sources'] is not None:
+        model['sources'] = default_sources()
+    return model
+
+
+def default_models():
+    return OrderedDict([('data_sources', [[sid, nickname, list(path)] for sid, nickname, path in data_sources]),
+                        ('logs', OrderedDict((log, default_model(log)) for log in logs))])
+
+
+# Sampling
+
+# Log-normal samples restricted to low < x < high
+def truncated_lognormal(rng, mu, sigma, low, high, size):
+    a = ndtr((np.log(low) - mu) / sigma) if low > 0 else 0.0
+    b = ndtr((np.log(high) - mu) / sigma) if np.isfinite(high) else 1.0
+    u = rng.uniform(a, b, size=size)
+    return np.exp(mu + sigma * ndtri(u))
+
+
+# Sample the time between a request and the data it asks for, in seconds
+def sample_lag(rng, lag, n):
+    component = np.searchsorted(np.cumsum(lag['fractions']) / np.sum(lag['fractions']), rng.random(n), side='right')
+    component = np.minimum(component, 2)
+    s = np.empty(n)
+    for k, (name, low, high) in enumerate((('negative', 0.0, np.inf),
+                                           ('real_time', 0.0, real_time_limit),
+                                           ('archival', real_time_limit, np.inf))):
+        these = component == k
+        s[these] = truncated_lognormal(rng, lag[name][0], lag[name][1], low, high, int(np.sum(these)))
+        if name == 'negative':
+            s[these] = -s[these]
+    return s
+
+
+# The number of requests on each day and in each burst.  The burst counts have
+# one row per event and one column per day after the event.
+def sample_days(rng, model, n):
+    first = day_number(model['start'])
+    trend = np.asarray(model['trend'], dtype=np.float64)
+    days = np.arange(first, first + len(trend))
+    rate = trend * np.asarray(model['weekday'])[weekday(days)]
+
+    events = [event for event in model['bursts'] if event in hvos.solar_physics_events and
+              0 <= day_number(hvos.solar_physics_events[event]['date']) - first < len(rate)]
+    burst = np.zeros((len(events), burst_window))
+    offsets = np.arange(burst_window)
+    for i, event in enumerate(events):
+        d = day_number(hvos.solar_physics_events[event]['date']) - first
+        inside = d + offsets < len(rate)
+        burst[i, inside] = model['bursts'][event] * rate[d] * np.exp(-offsets[inside] / burst_days)
+
+    p = np.concatenate([rate, burst.ravel()])
+    counts = rng.multinomial(n, p / np.sum(p))
+    return first, counts[:len(rate)], counts[len(rate):].reshape(burst.shape), events
+
+
+# Times of day, in seconds, of n requests
+def sample_time_of_day(rng, model, n):
+    hour = np.asarray(model['hour'], dtype=np.float64)
+    hours = np.searchsorted(np.cumsum(hour) / np.sum(hour), rng.random(n), side='right')
+    return 3600 * np.minimum(hours, 23) + rng.integers(0, 3600, size=n)
+
+
+# Formatting
+
+# Times as the bytes the logs write, YYYY-MM-DD HH:MM:SS
+def format_times(t):
+    t = np.asarray(t).astype('datetime64[s]')
+    days = t.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    years = months.astype('datetime64[Y]')
+    seconds = (t - days).astype(np.int64)
+    fields = ((0, 4, years.astype(np.int64) + 1970),
+              (5, 2, (months - years).astype(np.int64) + 1),
+              (8, 2, (days - months).astype(np.int64) + 1),
+              (11, 2, seconds // 3600),
+              (14, 2, seconds // 60 % 60),
+              (17, 2, seconds % 60))
+    b = np.empty((len(t), 19), dtype=np.uint8)
+    b[:] = np.frombuffer(b'0000-00-00 00:00:00', dtype=np.uint8)
+    for position, width, value in fields:
+        for k in range(width):
+            b[:, position + width - 1 - k] += (value // 10**k % 10).astype(np.uint8)
+    return b.view('S19').ravel()
+
+
+# A CSV field as bytes, quoted if it has to be
+def csv_field(s):
+    s = str(s)
+    if any(c in s for c in ',"\n'):
+        s = '"{:s}"'.format(s.replace('"', '""'))
+    return s.encode('utf-8')
+
+
+# Join columns of bytes into CSV lines
+def csv_lines(fields):
+    line = fields[0]
+    for field in fields[1:]:
+        line = np.char.add(np.char.add(line, b','), field)
+    return line
+
+
+# Write one log of n rows made from a model.  'nicknames' maps the data
+# source ids to their nicknames.  If legacy_path is given, the requests made
+# before legacy_end are written there instead, numbered from zero as the
+# prepare scripts expect of a legacy log.
+def write_log(path, log, n, model=None, nicknames=None, seed=seed, chunksize=chunksize, legacy_path=None):
+    if model is None:
+        model = default_model(log)
+    if nicknames is None:
+        nicknames = dict((str(sid), nickname) for sid, nickname, p in data_sources)
+    kind = logs[log]['kind']
+    oldest = np.datetime64(pd.Timestamp(earliest), 's')
+    rng = np.random.default_rng(seed)
+    first, day_counts, burst_counts, events = sample_days(rng, model, n)
+    event_times = np.array([np.datetime64(pd.Timestamp(hvos.solar_physics_events[event]['date']), 's')
+                            for event in events], dtype='datetime64[s]')
+
+    if 'sources' in model:
+        combinations = model['sources']['combinations']
+        source_ids = np.array([csv_field(c) for c in combinations])
+        source_names = np.array([csv_field(' , '.join(nicknames.get(s, s) for s in c.split(',')))
+                                 for c in combinations])
+        source_p = np.cumsum(model['sources']['weights'])
+        source_p = source_p / source_p[-1]
+
+    # Blocks of whole days with about chunksize rows
+    per_day = day_counts.copy()
+    for i in range(len(events)):
+        d = day_number(hvos.solar_physics_events[events[i]]['date']) - first
+        inside = d + np.arange(burst_window) < len(per_day)
+        per_day[d:d + burst_window] += burst_counts[i, inside]
+    ends = np.searchsorted(np.cumsum(per_day), np.arange(chunksize, np.sum(per_day), chunksize), side='left') + 1
+    bounds = np.unique(np.concatenate([[0], np.minimum(ends, len(per_day)), [len(per_day)]]))
+
+    header = (','.join(columns[kind]) + '\n').encode('utf-8')
+    split = np.datetime64(pd.Timestamp(legacy_end), 's') if legacy_path is not None else None
+    with open(path, 'wb') as f, open(os.devnull if legacy_path is None else legacy_path, 'wb') as legacy:
+        f.write(header)
+        legacy.write(header)
+        next_id = 0
+        next_legacy_id = 0
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            # The day of each request, and the event it follows if it is part
+            # of a burst
+            days = [np.repeat(np.arange(a, b), day_counts[a:b])]
+            event = [np.full(len(days[0]), -1)]
+            for i in range(len(events)):
+                d = day_number(hvos.solar_physics_events[events[i]]['date']) - first
+                k = np.arange(max(a - d, 0), min(b - d, burst_window))
+                days.append(np.repeat(d + k, burst_counts[i, k]))
+                event.append(np.full(len(days[-1]), i))
+            days = np.concatenate(days)
+            event = np.concatenate(event)
+            m = len(days)
+            if m == 0:
+                continue
+
+            t = ((first + days) * 86400 + sample_time_of_day(rng, model, m)).astype('datetime64[s]')
+            order = np.argsort(t, kind='stable')
+            t = t[order]
+            event = event[order]
+            in_burst = event >= 0
+
+            # The requests are in time order, so those of the legacy log come
+            # first
+            k = 0 if split is None else int(np.searchsorted(t, split))
+            ids = np.concatenate([np.arange(next_legacy_id, next_legacy_id + k),
+                                  np.arange(next_id, next_id + m - k)])
+            fields = [ids.astype('S'), format_times(t)]
+            next_legacy_id += k
+            next_id += m - k
+            if kind in ('movie', 'screenshot'):
+                # The data asked for ends lag seconds before the request, or
+                # just after the event for the requests in a burst
+                lag = sample_lag(rng, model['lag'], m).astype('timedelta64[s]')
+                data_end = t - lag
+                after_event = rng.integers(0, 12 * 3600, size=int(np.sum(in_burst))).astype('timedelta64[s]')
+                data_end[in_burst] = np.minimum(event_times[event[in_burst]] + after_event, t[in_burst])
+                data_end = np.maximum(data_end, oldest)
+                if kind == 'movie':
+                    duration = rng.lognormal(model['duration'][0], model['duration'][1], size=m).astype('timedelta64[s]')
+                    fields += [format_times(np.maximum(data_end - duration, oldest)), format_times(data_end)]
+                else:
+                    fields.append(format_times(data_end))
+                codes = np.searchsorted(source_p, rng.random(m), side='right')
+                codes = np.minimum(codes, len(source_p) - 1)
+                fields.append(source_ids[codes])
+                if kind == 'movie':
+                    fields.append(source_names[codes])
+            lines = csv_lines(fields)
+            if k > 0:
+                legacy.write(b'\n'.join(lines[:k].tolist()) + b'\n')
+            if k < m:
+                f.write(b'\n'.join(lines[k:].tolist()) + b'\n')
+
+
+# Write getDataSources.json and all the logs to a directory.  The number of
+# rows of each log is given by 'rows', or is 'scale' times the number of rows
+# of the real log the model was fitted to, or the default for the log.
+# Returns the paths written: the files of each log are listed in the order
+# the prepare scripts read them, the current log before the legacy log.
+def write_all(directory, rows=None, scale=None, models=None, seed=seed, chunksize=chunksize):
+    if models is None:
+        models = default_models()
+    os.makedirs(directory, exist_ok=True)
+    paths = OrderedDict()
+    paths['getDataSources'] = os.path.join(directory, 'getDataSources.json')
+    json.dump(get_data_sources(models['data_sources']), open(paths['getDataSources'], 'w'), indent=1)
+    nicknames = dict((str(sid), nickname) for sid, nickname, p in models['data_sources'])
+    for i, log in enumerate(logs):
+        model = models['logs'][log] if log in models['logs'] else default_model(log)
+        if rows is not None and log in rows:
+            n = rows[log]
+        elif scale is not None:
+            n = int(round(scale * model['rows']))
+        else:
+            n = logs[log]['rows']
+        paths[log] = [os.path.join(directory, logs[log][f]) for f in ('file', 'legacy') if logs[log][f] is not None]
+        print('Writing {:d} rows to {:s}'.format(n, ' and '.join(paths[log])))
+        write_log(paths[log][0], log, n, model=model, nicknames=nicknames, seed=seed + i, chunksize=chunksize,
+                  legacy_path=paths[log][1] if len(paths[log]) > 1 else None)
+    return paths
+
+
+if __name__ == '__main__':
+    # Fit the models to the derived data and write logs ten times the size of
+    # the real ones
+    models = fit()
+    save_models(models)
+    write_all(os.path.join(hvod.directory, 'synthetic'), scale=10, models=models)
@@ -0,0 +1,123 @@
+#
+# Text rendering of the analysis figures.  Publication figures have their
+# text typeset by LaTeX.  In draft mode the same hvorg_style labels are drawn
+# with matplotlib's mathtext instead, which needs no LaTeX run at all and is
+# much faster when iterating on the figures.
+#
+# LaTeX output is kept by matplotlib in its tex cache, one DVI and PNG per
+# piece of text, keyed by the text and the font settings, and so persists
+# between runs.  When several figures are drawn at the same time the distinct
+# pieces of text are typeset first, each once, so that the figures do not
+# typeset the same titles and legends over again.
+#
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.font_manager import FontProperties
+from matplotlib.text import Text
+from matplotlib.texmanager import TexManager
+
+import hvorg_trace as hvtrace
+
+# Draw the figures in draft mode
+draft = False
+# draft = True
+
+# Font size used in the figures
+size = 14
+
+# Braces used for grouping in LaTeX, which mathtext would draw outside math
+grouping = re.compile(r'(?<!\\)[{}]')
+
+
+# Set up the text rendering of the figures
+def setup(size=size, draft=None):
+    if draft is None:
+        draft = globals()['draft']
+    plt.rc('font', size=size)
+    if draft:
+        plt.rc('text', usetex=False)
+        plt.rc('mathtext', fontset='cm')
+        plt.rc('font', family='serif')
+    else:
+        plt.rc('text', usetex=True)
+
+
+# Whether the figures are drawn in draft mode
+def is_draft():
+    return not matplotlib.rcParams['text.usetex']
+
+
+# Text as mathtext draws it: LaTeX grouping braces outside math are removed
+def draft_text(s):
+    parts = re.split(r'(?<!\\)\$', s)
+    for i in range(0, len(parts), 2):
+        parts[i] = grouping.sub('', parts[i])
+    return '$'.join(parts)
+
+
+# Turn all the text of a figure into text mathtext can draw
+def draft_figure(fig):
+    for t in fig.findobj(Text):
+        text = t.get_text()
+        if text:
+            t.set_text(draft_text(text))
+
+
+# Save a figure, by default the current one.  In draft mode the text is made
+# drawable by mathtext first, and the figure laid out again since the text
+# has changed size.
+def savefig(filepath, fig=None, **kwargs):
+    if fig is None:
+        fig = plt.gcf()
+    with hvtrace.stage('save {:s}'.format(os.path.basename(filepath))):
+        if is_draft():
+            draft_figure(fig)
+            fig.tight_layout()
+        fig.savefig(filepath, **kwargs)
+
+
+# The size in points of a font size from rcParams, such as 'large'
+def points(fontsize):
+    return FontProperties(size=fontsize).get_size_in_points()
+
+
+# Typeset one piece of text at one font size into the tex cache
+def typeset_one(tex, fontsize, dpi, rc=None):
+    if rc is not None:
+        matplotlib.rcParams.update(rc)
+    texmanager = TexManager()
+    texmanager.make_dvi(tex, fontsize)
+    texmanager.make_png(tex, fontsize, dpi)
+
+
+# The pieces of text matplotlib typesets to lay out and draw a text at a font
+# size: each of its lines on its own, and 'lp', which sets the height of the
+# lines
+def pieces(tex, fontsize):
+    lines = [line if line != ' ' else r'\ ' for line in tex.split('\n')]
+    return [(line, fontsize) for line in lines + ['lp'] if line]
+
+
+# Typeset the distinct (text, font size) pairs into the tex cache, up to
+# 'workers' at the same time.  Each line of a text is typeset on its own, as
+# matplotlib does.  Text already in the cache is not typeset again.  Nothing
+# is done in draft mode.
+def typeset(texts, workers=1, dpi=None, rc=None):
+    if is_draft():
+        return
+    if dpi is None:
+        dpi = matplotlib.rcParams['savefig.dpi']
+        if dpi == 'figure':
+            dpi = matplotlib.rcParams['figure.dpi']
+    texts = sorted(set((piece, float(size)) for tex, fontsize in texts if tex
+                       for piece, size in pieces(tex, fontsize)))
+    if workers <= 1 or len(texts) <= 1:
+        for tex, fontsize in texts:
+            typeset_one(tex, fontsize, dpi)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(texts))) as executor:
+        list(executor.map(typeset_one, [t[0] for t in texts], [t[1] for t in texts],
+                          [dpi] * len(texts), [rc] * len(texts)))
@@ -0,0 +1,162 @@
+#
+# Fast parsing of the timestamps found in the Helioviewer and JHelioviewer
+# request logs
+#
+import datetime
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import astropy.units as u
+from sunpy.time import parse_time
+
+# Formats tried, in order, when detecting the format of a column of times
+formats = ('%Y-%m-%d %H:%M:%S',
+           '%Y-%m-%dT%H:%M:%S',
+           '%Y-%m-%d %H:%M:%S.%f',
+           '%Y-%m-%dT%H:%M:%S.%f',
+           '%Y-%m-%dT%H:%M:%SZ',
+           '%Y-%m-%dT%H:%M:%S.%fZ',
+           '%Y/%m/%d %H:%M:%S',
+           '%Y/%m/%dT%H:%M:%S',
+           '%Y-%m-%d')
+
+# One second as a numpy time difference
+one_second = np.timedelta64(1, 's')
+
+
+# Number of values of a column used to detect its format
+sample_size = 100
+
+
+# Find the format that parses the most of a sample of the usable values in
+# the column, spread evenly through it, so that a few malformed values do not
+# decide the format.  Formats earlier in 'formats' win ties.  Returns None if
+# no format matches any of the sample.
+def detect_format(values, formats=formats, sample_size=sample_size):
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    s = s.dropna()
+    if len(s) == 0:
+        return None
+    sample = s.iloc[np.unique(np.linspace(0, len(s) - 1, min(sample_size, len(s))).astype(np.int64))]
+    sample = pd.Series([value.strip() for value in sample if isinstance(value, str) and value.strip() != ''],
+                       dtype=object)
+    if len(sample) == 0:
+        return None
+    best, matched = None, 0
+    for fmt in formats:
+        n = int(pd.to_datetime(sample, format=fmt, errors='coerce').notnull().sum())
+        if n > matched:
+            best, matched = fmt, n
+    return best
+
+
+# Convert the output of sunpy's parse_time to a numpy datetime64[ns].  Older
+# versions of sunpy return a datetime, newer versions an astropy Time.
+def as_datetime64(t):
+    if hasattr(t, 'datetime64'):
+        return np.datetime64(t.datetime64, 'ns')
+    return np.datetime64(t, 'ns')
+
+
+# Parse a whole column of times into a datetime64[ns] array.  The format is
+# detected once and all the rows that match it are parsed in one vectorized
+# pass.  Only the rows that do not match fall back to sunpy's parse_time.
+# Missing values always become NaT, even with errors='raise'.  If
+# errors='coerce', values parse_time cannot understand also become NaT,
+# otherwise the parse_time error is raised.
+def parse_times(values, fmt=None, errors='raise'):
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    s = s.reset_index(drop=True)
+    if fmt is None:
+        fmt = detect_format(s)
+
+    if fmt is None:
+        t = pd.Series(pd.NaT, index=s.index, dtype='datetime64[ns]')
+    else:
+        t = pd.to_datetime(s, format=fmt, errors='coerce')
+    t = t.values.astype('datetime64[ns]')
+
+    # Rows that did not match the fast path
+    unmatched = np.flatnonzero(np.isnat(t) & s.notnull().values)
+    for i in unmatched:
+        try:
+            t[i] = as_datetime64(parse_time(s.iloc[i]))
+        except Exception:
+            if errors != 'coerce':
+                raise
+    return t
+
+
+# Parse a column of times in a single pass, flagging the values that cannot be
+# parsed.  Returns the times, NaT where a value is invalid, and the validity of
+# each value.
+def parse_validated(values, fmt=None):
+    t = parse_times(values, fmt=fmt, errors='coerce')
+    return t, ~np.isnat(t)
+
+
+# Time differences as floating point seconds
+def seconds(dt):
+    return dt / one_second
+
+
+# Number of seconds in a unit of time such as u.day, worked out once per unit
+_seconds_per = {}
+
+
+def seconds_per(unit):
+    if unit not in _seconds_per:
+        _seconds_per[unit] = (1 * unit).to(u.s).value
+    return _seconds_per[unit]
+
+
+# Durations in plain float seconds expressed in another unit of time.  This
+# is the fast path for whole arrays: no astropy Quantity is made, just one
+# scaled array.
+def in_unit(s, unit):
+    return np.asarray(s) * (1.0 / seconds_per(unit))
+
+
+# A duration given as an astropy Quantity, such as a threshold of 30*u.day, as
+# plain float seconds so it can be compared with arrays of seconds
+def quantity_seconds(q):
+    return q.value * seconds_per(q.unit)
+
+
+# Convert a datetime64 array into a list of datetime objects.  NaT becomes None.
+def to_datetime_list(t):
+    return np.asarray(t).astype('datetime64[us]').astype(object).tolist()
+
+
+# Derive the times of interest from a block of a movie log.  The keys name the
+# derived quantities as they appear in the names of the saved files.
+def movie_times(df):
+    request_time = parse_times(df.timestamp)
+    start_time = parse_times(df.StartDate)
+    end_time = parse_times(df.EndDate)
+    duration = end_time - start_time
+    return OrderedDict([('request_time', request_time),
+                        ('start_time', start_time),
+                        ('end_time', end_time),
+                        ('durations_seconds', seconds(duration)),
+                        ('mid_point_seconds', start_time + duration / 2),
+                        ('time_difference_seconds', seconds(request_time - start_time)),
+                        ('topicality_seconds', seconds(request_time - end_time))])
+
+
+# Derive the times of interest from a block of the screenshot log.  Times that
+# cannot be parsed are NaT and flagged as invalid.  The time difference is
+# only calculated where both times are valid.
+def screenshot_times(df):
+    request_time, request_time_validity = parse_validated(df.timestamp)
+    observation_time, observation_time_validity = parse_validated(df.ObservationDate)
+    both = request_time_validity & observation_time_validity
+    return OrderedDict([('request_time', request_time),
+                        ('request_time_validity', request_time_validity),
+                        ('observation_time_validity', observation_time_validity),
+                        ('time_difference_seconds', seconds(request_time[both] - observation_time[both]))])
+
+
+# The request times of a block of a log that records nothing else of interest
+def request_times(df):
+    return OrderedDict([('request_time', parse_times(df.timestamp))])
@@ -0,0 +1,207 @@
+#
+# Instrumentation of the prepare and analysis scripts.  The named stages of a
+# run, such as reading a log, parsing its times or drawing a figure, are
+# recorded with their wall time, CPU time, peak resident memory and the number
+# of rows they handled.  Stages can be nested.  At the end of the run the
+# trace is written in the Chrome trace event format, which chrome://tracing,
+# Perfetto and speedscope show as a timeline and a flame graph, and as folded
+# stacks for flamegraph.pl.
+#
+# When tracing is off, stage() returns one shared object that does nothing,
+# so the instrumentation can stay in the scripts at almost no cost.
+#
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+from collections import OrderedDict
+
+import hvorg_derived as hvod
+
+# Record the stages.  HVORG_TRACE=1 in the environment also turns tracing on.
+enabled = os.environ.get('HVORG_TRACE', '0') not in ('', '0')
+# enabled = True
+
+# Where the traces are written
+trace_directory = os.path.join(hvod.directory, 'traces')
+
+# The stages recorded so far, and the stages running now, innermost last
+events = []
+running = []
+registered = []
+
+
+# CPU time used by this process and its finished children, in seconds
+def cpu_time():
+    s = resource.getrusage(resource.RUSAGE_SELF)
+    c = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return s.ru_utime + s.ru_stime + c.ru_utime + c.ru_stime
+
+
+# Peak resident set size of this process and its finished children over the
+# whole run, in bytes
+def peak_rss():
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return scale * max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+# Peak resident set size of this process since the high water mark was last
+# reset, in bytes.  Where Linux's /proc is not available this is the peak over
+# the whole run.
+def high_water_mark():
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return 1024 * int(line.split()[1])
+    except OSError:
+        pass
+    return peak_rss()
+
+
+# Start the high water mark again from the current resident set size, if the
+# system allows it
+def reset_high_water_mark():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+# Stands in for a stage when tracing is off
+class NoStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, rows):
+        pass
+
+    def end(self):
+        pass
+
+
+no_stage = NoStage()
+
+
+class Stage(object):
+    def __init__(self, name, rows=None, args=None):
+        self.name = name
+        self.rows = rows
+        self.args = {} if args is None else args
+
+    # Add to the number of rows handled
+    def count(self, rows):
+        self.rows = (0 if self.rows is None else self.rows) + int(rows)
+
+    def __enter__(self):
+        # The peak of the enclosing stage so far is kept before the high water
+        # mark is reset for this one
+        if running:
+            running[-1].peak = max(running[-1].peak, high_water_mark())
+        reset_high_water_mark()
+        self.peak = 0
+        self.stack = tuple(s.name for s in running) + (self.name,)
+        running.append(self)
+        self.cpu = cpu_time()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.time() - self.start
+        cpu = cpu_time() - self.cpu
+        running.pop()
+        self.peak = max(self.peak, high_water_mark())
+        if running:
+            running[-1].peak = max(running[-1].peak, self.peak)
+        args = OrderedDict([('cpu_seconds', cpu), ('peak_rss_bytes', self.peak)])
+        if self.rows is not None:
+            args['rows'] = int(self.rows)
+        args.update(self.args)
+        record(self.name, self.start, duration, args, stack=self.stack)
+        return False
+
+    # Finish a stage started with begin()
+    def end(self):
+        self.__exit__(None, None, None)
+
+
+# A stage of the run, used as
+#
+#     with hvtrace.stage('parse times', rows=len(df)):
+#         ...
+#
+# Extra keyword arguments are recorded with the stage.
+def stage(name, rows=None, **args):
+    if not enabled:
+        return no_stage
+    if not registered:
+        atexit.register(save)
+        registered.append(True)
+    return Stage(name, rows=rows, args=args)
+
+
+# Start a stage that spans more code than is convenient to put in a with
+# block.  Call end() on what is returned when the stage is over.
+def begin(name, rows=None, **args):
+    return stage(name, rows=rows, **args).__enter__()
+
+
+# Record a stage that has finished, such as one run in a worker process.
+# 'start' is the time.time() it started at.  It is placed under the stages
+# running now unless 'stack' is given.  'tid' is the process it ran in, which
+# is shown as a thread of this one.
+def record(name, start, duration, args=None, stack=None, tid=None):
+    if not enabled:
+        return
+    if stack is None:
+        stack = tuple(s.name for s in running) + (name,)
+    events.append({'name': name,
+                   'ph': 'X',
+                   'ts': 1e6 * start,
+                   'dur': 1e6 * duration,
+                   'pid': os.getpid(),
+                   'tid': os.getpid() if tid is None else tid,
+                   'args': {} if args is None else dict(args),
+                   'stack': list(stack)})
+
+
+# The stages as folded stacks: one line per stack of stage names, with the
+# time spent in the stage itself and not in the stages inside it, in
+# microseconds
+def folded(events=events):
+    total = OrderedDict()
+    inside = {}
+    for event in events:
+        stack = tuple(event['stack'])
+        total[stack] = total.get(stack, 0.0) + event['dur']
+        inside[stack[:-1]] = inside.get(stack[:-1], 0.0) + event['dur']
+    return ['{:s} {:d}'.format(';'.join(stack), int(max(value - inside.get(stack, 0.0), 0)))
+            for stack, value in total.items()]
+
+
+# Write the trace of this run, named after 'script' and by default after the
+# script being run.  The stages written are forgotten.  Returns the files
+# written.
+def save(directory=trace_directory, script=None):
+    if not events:
+        return []
+    if script is None:
+        script = os.path.splitext(os.path.basename(sys.argv[0]))[0] if sys.argv and sys.argv[0] else 'python'
+    name = '{:s}_{:s}_{:d}'.format(script, time.strftime('%Y%m%dT%H%M%S'), os.getpid())
+    os.makedirs(directory, exist_ok=True)
+    f = os.path.join(directory, '{:s}.json'.format(name))
+    trace = {'traceEvents': [dict((k, v) for k, v in event.items() if k != 'stack') for event in events],
+             'displayTimeUnit': 'ms',
+             'otherData': {'argv': sys.argv, 'peak_rss_bytes': peak_rss()}}
+    json.dump(trace, open(f, 'w'))
+    g = os.path.join(directory, '{:s}.folded'.format(name))
+    open(g, 'w').write('\n'.join(folded(events)) + '\n')
+    del events[:]
+    return [f, g]
@@ -3,17 +3,21 @@
 #
 
 import os
-import pickle
-from copy import deepcopy
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 import astropy.units as u
 from sunpy.time import parse_time
 
 import hvorg_style as hvos
-plt.rc('text', usetex=True)
-plt.rc('font', size=14)
+import hvorg_tex as hvotex
+import hvorg_time as hvot
+import hvorg_derived as hvod
+import hvorg_metrics as hvom
+import hvorg_counts as hvcount
+import hvorg_render as hvrender
+import hvorg_rollup as hvroll
+import hvorg_trace as hvtrace
+hvotex.setup(size=14)
 figsize = (10, 5)
 
 restriction = 'observable'
@@ -23,7 +27,7 @@ restriction = 'observable'
 topicality_calculated_using = 'movie_end_time'
 
 # Read in the data
-directory = os.path.expanduser('~/Data/hvanalysis/derived')
+directory = hvod.directory
 
 # Image output location
 img = hvos.img
@@ -42,100 +46,73 @@ data_analyzed = '{:s} {:s}'.format(application, data_product)
 data_type = '{:s} ({:s})'.format(data_analyzed, restriction)
 
 # How much time did the movie cover?
-f = os.path.join(directory, "{:s}_movie_durations_seconds.npy".format(application_short))
-movie_durations = np.load(f)
+movie_durations = hvod.load("{:s}_movie_durations_seconds".format(application_short), directory=directory)
 durations_subtitle = "{:s} = {:s} - {:s}".format(hvos.durations['tmduration'][0], hvos.dates['Tmend'], hvos.dates['Tmstart'])
 
 # Save the time information
-f = os.path.join(directory, '{:s}_movie_mid_point_seconds.npy'.format(application_short))
-movie_mid_point = np.load(f)
+movie_mid_point = hvod.load('{:s}_movie_mid_point_seconds'.format(application_short), directory=directory)
 
 # Time difference
-f = os.path.join(directory, '{:s}_movie_time_difference_seconds.npy'.format(application_short))
-time_difference = np.load(f)
+time_difference = hvod.load('{:s}_movie_time_difference_seconds'.format(application_short), directory=directory)
 
 # Movie start times
-f = os.path.join(directory, "{:s}_movie_start_time.pkl".format(application_short))
-movie_start_time = pickle.load(open(f, 'rb'))
+movie_start_time = hvod.load("{:s}_movie_start_time".format(application_short), directory=directory)
 movie_start_time_date = hvos.dates['Tmstart']
 
 # Movie end times
-f = os.path.join(directory, "{:s}_movie_end_time.pkl".format(application_short))
-movie_end_time = pickle.load(open(f, 'rb'))
+movie_end_time = hvod.load("{:s}_movie_end_time".format(application_short), directory=directory)
 movie_end_time_date = hvos.dates['Tmend']
 
 # Movie request times
-f = os.path.join(directory, "{:s}_movie_request_time.pkl".format(application_short))
-movie_request_time = pickle.load(open(f, 'rb'))
+movie_request_time = hvod.load("{:s}_movie_request_time".format(application_short), directory=directory)
 
 # Number of movies
 nmovies = len(movie_start_time)
 
 # Topicality - calculate the time difference between the time of the request and the movie start time.
 if topicality_calculated_using == 'movie_end_time':
-    topicality = np.asarray([(movie_request_time[i] - movie_end_time[i]).total_seconds() for i in range(0, nmovies)])
     topicality_subtitle = "{:s} = {:s} - {:s}".format(hvos.durations['tmtopicality'][0], hvos.dates['Tmrequest'], movie_end_time_date)
 
 if topicality_calculated_using == 'movie_start_time':
-    topicality = np.asarray([(movie_request_time[i] - movie_start_time[i]).total_seconds() for i in range(0, nmovies)])
     topicality_subtitle = "{:s} = {:s} - {:s}".format(hvos.durations['tmtopicality'][0], hvos.dates['Tmrequest'], movie_start_time_date)
 
-# Calculate the time difference between the time of the request and the movie end time.  Positive values
-# indicate that the time the request was made was definitely after the movie end time.
-proximity_to_real_time = np.asarray([(movie_request_time[i] - movie_end_time[i]).total_seconds() for i in range(0, nmovies)])
-
-
-# Estimated maximum movie durations
-estimated_maximum_duration = []
-for i in range(0, nmovies):
-    if movie_request_time[i] < movie_end_time[i]:
-        estimated_maximum_duration.append((movie_request_time[i] - movie_start_time[i]).total_seconds())
-    else:
-        estimated_maximum_duration.append((movie_end_time[i] - movie_start_time[i]).total_seconds())
-estimated_maximum_duration = np.asarray(estimated_maximum_duration)
-
-# The movie has a non-zero duration
-positive_duration = movie_durations > 0
-
-# It was physically possible that we had data for the entire request?
-physically_possible = proximity_to_real_time > 0
-
-# What kind of restrictions can we put on the times
-if restriction == 'observable':
-    data_observable = np.logical_and(positive_duration, physically_possible)
-
-if restriction == 'positive requested duration':
-    data_observable = deepcopy(positive_duration)
+# The topicality, the proximity to real time, the estimated maximum movie
+# durations and which movies are kept under each restriction, all in one pass
+with hvtrace.stage('movie metrics', rows=nmovies):
+    metrics = hvom.movie_metrics(movie_request_time, movie_start_time, movie_end_time, durations=movie_durations,
+                                 topicality_calculated_using=topicality_calculated_using)
+topicality = metrics['topicality']
+proximity_to_real_time = metrics['proximity_to_real_time']
+estimated_maximum_duration = metrics['estimated_maximum_duration']
+positive_duration = metrics['positive_duration']
+physically_possible = metrics['physically_possible']
+data_observable = metrics['data_observable'][restriction]
+
+# Sorted index of all the topicalities
+topicality_index = hvcount.SortedIndex(topicality)
 
 # Positive and negative topicality needs its own exploration.
 # Figure 2a: positive and negative topicality
-td = topicality * u.s
+figures = []
 td_short_unit = u.day
 td_short_fraction = 24*4
 td_short_limit = 8 * u.day
-td_short = td[np.abs(td) < td_short_limit]
+td_short_counts, td_short_edges = topicality_index.histogram(int(td_short_limit.to(td_short_unit).value*td_short_fraction),
+                                                              low=-hvot.quantity_seconds(td_short_limit),
+                                                              high=hvot.quantity_seconds(td_short_limit),
+                                                              low_inclusive=False, high_inclusive=False)
 topicality_subtitle = "{:s} = {:s} - {:s}, $\mid${:s}$\mid$".format(hvos.durations['tmtopicality'][0], hvos.dates['Tmrequest'], movie_end_time_date,hvos.durations['tmtopicality'][0])
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-plt.hist(td_short.to(td_short_unit).value, bins=int(td_short_limit.to(td_short_unit).value*td_short_fraction))
-ax.grid(True, linestyle='dotted')
 rl = hvos.relevant_lines(hvos.lines, tr=[0, td_short_limit.to(u.day).value]*u.day)
-for key in list(rl.keys()):
-    kwargs = rl[key]
-    kwargs['label'] = str(key)
-    plt.axvline(key.to(td_short_unit).value, **kwargs)
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)))
-plt.ylabel(hvos.mlabel(len(td_short)))
-plt.title('{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_analyzed, topicality_subtitle, "$\le$", td_short_limit))
-plt.xlim(-td_short_limit.to(u.day).value, td_short_limit.to(u.day).value)
-plt.legend()
-plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, 'topicality_positive_negative'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': td_short_counts, 'edges': hvot.in_unit(td_short_edges, td_short_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)),
+                               ylabel=hvos.mlabel(np.sum(td_short_counts)),
+                               title='{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_analyzed, topicality_subtitle, "$\leq$", td_short_limit),
+                               vlines=hvrender.line_positions(rl, td_short_unit),
+                               xlim=(-td_short_limit.to(u.day).value, td_short_limit.to(u.day).value),
+                               legend=True))
 
 # Restrict the movies we will look at.
 td = topicality[data_observable]
@@ -144,108 +121,78 @@ md = movie_durations[data_observable]
 # How many good movies?
 ngood = len(td)
 
-# Apply units - makes handling time durations much easier.
-td = td * u.s
-md = md * u.s
+# Sorted indices of the topicalities and durations, so that the histograms
+# below can be made for any range without filtering the arrays again
+td_index = hvcount.SortedIndex(td)
+md_index = hvcount.SortedIndex(md)
 
+# The durations stay as plain float seconds.  Units are only applied to the
+# thresholds and when the values are scaled for plotting.
 
-# Scatter plot of time difference versus movie duration
+
+# Scatter plot of time difference versus movie duration, drawn as the density
+# of movies in logarithmically spaced bins
 md_scatter_unit = u.day
 td_scatter_unit = u.day
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-md_value = md.to(md_scatter_unit).value
-td_value = td.to(td_scatter_unit).value
-plt.scatter(md_value, td_value, s=1)
-plt.yscale('log')
-plt.xscale('log')
-mtd_min = np.min([md.to(md_scatter_unit).min().value, md.to(md_scatter_unit).min().value])
-mtd_max = np.max([md.to(md_scatter_unit).max().value, md.to(md_scatter_unit).max().value])
-plt.plot([mtd_min, mtd_max], [mtd_min, mtd_max], color='k', label='equality')
-
-for line in list(hvos.lines.keys()):
-    kwargs = hvos.lines[line]
-    plt.axvline(line.to(md_scatter_unit).value, **kwargs)
-for line in list(hvos.lines.keys()):
-    kwargs = hvos.lines[line]
-    plt.axhline(line.to(md_scatter_unit).value, label=str(line), **kwargs)
-
-plt.xlabel(hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_scatter_unit)))
-plt.ylabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_scatter_unit)))
-plt.legend()
-plt.title(data_type + '\n' + '{{{:s}}} total'.format(str(len(md))))
-plt.tight_layout()
+scatter_bins = 200
+scatter_counts, md_scatter_edges, td_scatter_edges = hvcount.log_histogram2d(hvot.in_unit(md, md_scatter_unit),
+                                                                             hvot.in_unit(td, td_scatter_unit),
+                                                                             bins=scatter_bins)
 filename = hvos.overleaf(os.path.join(data_type, 'scatter_duration_vs_topicality'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.density, os.path.join(img, filename),
+                               data={'counts': scatter_counts, 'xedges': md_scatter_edges, 'yedges': td_scatter_edges},
+                               equality=(md_scatter_edges[0], md_scatter_edges[-1]),
+                               xlabel=hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_scatter_unit)),
+                               ylabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_scatter_unit)),
+                               clabel='number of movies',
+                               title=data_type + '\n' + '{{{:s}}} total'.format(str(len(md))),
+                               vlines=hvrender.line_positions(hvos.lines, md_scatter_unit, label=False),
+                               hlines=hvrender.line_positions(hvos.lines, md_scatter_unit)))
 
 
 # Figure 1 : topicality
 topicality_unit = u.year
 overall_td_bins = 100
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-plt.hist(td.to(topicality_unit).value, bins=overall_td_bins)
-ax.grid(True, linestyle='dotted')
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(topicality_unit)))
-plt.ylabel(hvos.mlabel(len(td)))
-plt.title('{{{:s}}}\n{{{:s}}}'.format(data_type, topicality_subtitle))
-plt.tight_layout()
+td_counts, td_edges = td_index.histogram(overall_td_bins)
 filename = hvos.overleaf(os.path.join(data_type, 'topicality'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': td_counts, 'edges': hvot.in_unit(td_edges, topicality_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(topicality_unit)),
+                               ylabel=hvos.mlabel(len(td)),
+                               title='{{{:s}}}\n{{{:s}}}'.format(data_type, topicality_subtitle)))
 
 
 # Figure 2: topicality < 30 days
 td_short_limit = 30*u.day
-td_short = td[td <= td_short_limit]
 td_short_unit = u.day
 td_short_fraction = 24
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-plt.hist(td_short.to(td_short_unit).value, bins=int(td_short_limit.to(td_short_unit).value*td_short_fraction))
-ax.grid(True, linestyle='dotted')
+td_short_counts, td_short_edges = td_index.histogram(int(td_short_limit.to(td_short_unit).value*td_short_fraction),
+                                                     high=hvot.quantity_seconds(td_short_limit))
 rl = hvos.relevant_lines(hvos.lines, tr=[0, 30]*u.day)
-for key in list(rl.keys()):
-    kwargs = rl[key]
-    kwargs['label'] = str(key)
-    plt.axvline(key.to(td_short_unit).value, **kwargs)
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)))
-plt.ylabel(hvos.mlabel(len(td_short)))
-plt.title('{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, topicality_subtitle, "$\le$", td_short_limit))
-plt.legend()
-plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, 'topicality_{:s}'.format(str(td_short_limit))))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
-
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': td_short_counts, 'edges': hvot.in_unit(td_short_edges, td_short_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmtopicality'][1], hvos.durations['tmtopicality'][0], str(td_short_unit)),
+                               ylabel=hvos.mlabel(np.sum(td_short_counts)),
+                               title='{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, topicality_subtitle, "$\leq$", td_short_limit),
+                               vlines=hvrender.line_positions(rl, td_short_unit),
+                               legend=True))
 
 
 # Figure 3
 # Plot a histogram of movie durations
 md_unit = u.year
-plt.close('all')
-fig = plt.figure(figsize=figsize)
-ax = fig.add_subplot(111)
-plt.hist(md.to(md_unit).value, bins=100)
-ax.grid(True, linestyle='dotted')
-plt.yscale('log')
-plt.xlabel(hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_unit)))
-plt.ylabel(hvos.mlabel(len(md)))
-plt.title('{{{:s}}}\n {{{:s}}}'.format(data_type, durations_subtitle))
-plt.tight_layout()
+md_counts, md_edges = md_index.histogram(100)
 filename = hvos.overleaf(os.path.join(data_type, 'duration'))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename), figsize=figsize,
+                               data={'counts': md_counts, 'edges': hvot.in_unit(md_edges, md_unit)},
+                               xlabel=hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_unit)),
+                               ylabel=hvos.mlabel(len(md)),
+                               title='{{{:s}}}\n {{{:s}}}'.format(data_type, durations_subtitle)))
 
 # Figure 4
 # Plot a histogram of movie durations
@@ -253,71 +200,71 @@ md_short_fraction = 2
 for fhist in ((2*u.day, u.hour), (30*u.day, u.day)):
     md_short_limit = fhist[0]
     md_short_unit = fhist[1]
-    md_short = md[md < md_short_limit]
-    plt.close('all')
-    fig = plt.figure()
-    ax = fig.add_subplot(111)
-    plt.hist(md_short.to(md_short_unit).value, bins=int(md_short_limit.to(md_short_unit).value*md_short_fraction))
-    ax.grid(True, linestyle='dotted')
+    md_short_counts, md_short_edges = md_index.histogram(int(md_short_limit.to(md_short_unit).value*md_short_fraction),
+                                                         high=hvot.quantity_seconds(md_short_limit),
+                                                         high_inclusive=False)
     rl = hvos.relevant_lines(hvos.lines, tr=[0, md_short_limit.to(u.day).value]*u.day)
-    for key in list(rl.keys()):
-        kwargs = rl[key]
-        kwargs['label'] = str(key)
-        plt.axvline(key.to(md_short_unit).value, **kwargs)
-    plt.yscale('log')
-    plt.xlabel(hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_short_unit)))
-    plt.ylabel(hvos.mlabel(len(md_short)))
-    plt.title('{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, durations_subtitle, "$\le$", md_short_limit))
-    plt.legend()
-    plt.tight_layout()
     filename = hvos.overleaf(os.path.join(data_type, 'duration_{:s}'.format(str(md_short_limit))))
     filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-    filepath = os.path.join(img, filename)
-    plt.savefig(filepath)
-
+    figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                                   data={'counts': md_short_counts, 'edges': hvot.in_unit(md_short_edges, md_short_unit)},
+                                   xlabel=hvos.qlabel(hvos.durations['tmduration'][1], hvos.durations['tmduration'][0], str(md_short_unit)),
+                                   ylabel=hvos.mlabel(np.sum(md_short_counts)),
+                                   title='{{{:s}}}\n{{{:s}}} {{{:s}}} {{{:s}}}'.format(data_type, durations_subtitle, "$\leq$", md_short_limit),
+                                   vlines=hvrender.line_positions(rl, md_short_unit),
+                                   legend=True))
 
 # Figure 6
 # Number of requests as a function of time
 title = 'movies per quarter'
-df = pd.DataFrame(movie_request_time, columns=['date'])
-# Setting the date as the index since the TimeGrouper works on Index, the date column is not dropped to be able to count
-df.set_index('date', drop=False, inplace=True)
-
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='Q')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
-h.plot(kind='bar', ax=ax)
-new_ticks = []
-for dt in h.index:
-    new_ticks.append(dt.to_datetime())
-ax.set_xticklabels([dt.strftime('%Y-%m-%d') for dt in new_ticks])
-ax.set_title(title)
-ax.set_ylabel(hvos.mlabel(len(movie_request_time)))
-ax.set_xlabel('date')
-ax.xaxis.set_tick_params(labelsize=10)
-ax.grid(linestyle='dotted')
-fig.autofmt_xdate(rotation=65)
-plt.legend()
-plt.tight_layout()
+h = hvroll.counts('jhv_movie', 'Q', name='movies', directory=directory)
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.bars, os.path.join(img, filename),
+                               data={'counts': h.values},
+                               ticklabels=[dt.strftime('%Y-%m-%d') for dt in h.index.to_pydatetime()],
+                               label='movies',
+                               xlabel='date',
+                               ylabel=hvos.mlabel(len(movie_request_time)),
+                               title=title))
+
+# Daily numbers, drawn as a plot in figure 7 and as a distribution in figure 8
+h = hvroll.counts('jhv_movie', 'D', name='movies', directory=directory).to_frame()
+movies_per_day = np.asarray(list(h["movies"]))
+mean = int(np.rint(np.mean(movies_per_day)))
+median = int(np.rint(np.median(movies_per_day)))
+
+# Figure 8
+# Distribution of the number of movies made per day
+title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
+per_day_counts, per_day_edges = np.histogram(movies_per_day, bins=60)
+per_day_lines = [(mean, {'color': 'r', 'linestyle': 'dashed', 'label': 'mean ({{{:n}}})'.format(mean)}),
+                 (median, {'color': 'k', 'linestyle': 'dashed', 'label': 'median ({{{:n}}})'.format(median)})]
+filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
+filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': per_day_counts, 'edges': per_day_edges},
+                               label='movies',
+                               vlines=per_day_lines,
+                               xlabel='number of movies per day',
+                               ylabel='number of days\n[{{{:n}}} total]'.format(len(movies_per_day)),
+                               title='{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)),
+                               legend=True,
+                               framealpha=0.2))
+
+# Draw the figures above at the same time.  Figures that have not changed
+# since they were last drawn are skipped.  The group names the data type,
+# which includes the restriction, so that figures drawn before under another
+# restriction are kept.
+hvrender.render(figures, group='{:s}_movies_analyze {:s}'.format(application_short, data_type))
 
 # Figure 7
+figure = hvtrace.begin('figure 7')
 # Daily numbers as a plot
 title = 'daily movies requested'
 plt.close('all')
 fig = plt.figure(figsize=figsize)
 ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='D')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
-
-movies_per_day = np.asarray(list(h["movies"]))
-mean = np.int(np.rint(np.mean(movies_per_day)))
-median = np.int(np.rint(np.median(movies_per_day)))
 h.plot(kind='line', ax=ax)
 ax.axhline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
 ax.axhline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
@@ -343,24 +290,5 @@ plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
 filepath = os.path.join(img, filename)
-plt.savefig(filepath)
-
-
-# Figure 8
-# Distribution of the number of movies made per day
-title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
-plt.close('all')
-plt.hist(movies_per_day, bins=60, label='movies')
-plt.axvline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
-plt.axvline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
-plt.yscale('log')
-plt.xlabel('number of movies per day')
-plt.ylabel('number of days\n[{{{:n}}} total]'.format(len(movies_per_day)))
-plt.title('{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)))
-plt.grid('on', linestyle='dotted')
-plt.legend(framealpha=0.2)
-plt.tight_layout()
-filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
-filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+hvotex.savefig(filepath)
+figure.end()
@@ -3,23 +3,25 @@
 #
 
 import os
-import pickle
 from copy import deepcopy
 import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
 import astropy.units as u
 from sunpy.time import parse_time
 
 import hvorg_style as hvos
-plt.rc('text', usetex=True)
-plt.rc('font', size=14)
+import hvorg_tex as hvotex
+import hvorg_derived as hvod
+import hvorg_render as hvrender
+import hvorg_rollup as hvroll
+import hvorg_trace as hvtrace
+hvotex.setup(size=14)
 figsize = (10, 5)
 
 topicality_calculated_using = 'movie_end_time'
 
 # Read in the data
-directory = os.path.expanduser('~/Data/hvanalysis/derived')
+directory = hvod.directory
 
 # Event annotation style
 edit = 1
@@ -38,56 +40,70 @@ img = os.path.join(os.path.expanduser(hvos.img), application)
 data_analyzed = '{:s} {:s}'.format(application, data_product)
 data_type = '{:s}'.format(data_analyzed)
 
+load = hvtrace.begin('load derived data')
 # Movie request times
-f = os.path.join(directory, "jhv_movie_request_timestamps_only.pkl")
-movie_request_time = pickle.load(open(f, 'rb'))
+movie_request_time = hvod.load("jhv_movie_request_timestamps_only", directory=directory)
+load.end()
 
 # Number of movies
 nmovies = len(movie_request_time)
 
 
+# The figures drawn at the same time
+figures = []
+
 # Figure 6
 # Number of requests as a function of time
 title = '{:s} movies per quarter'.format(application)
-df = pd.DataFrame(movie_request_time, columns=['date'])
-# Setting the date as the index since the TimeGrouper works on Index, the date column is not dropped to be able to count
-df.set_index('date', drop=False, inplace=True)
-
-plt.close('all')
-fig = plt.figure()
-ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='Q')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
-h.plot(kind='bar', ax=ax)
-new_ticks = []
-for dt in h.index:
-    new_ticks.append(dt.to_datetime())
-ax.set_xticklabels([dt.strftime('%Y-%m-%d') for dt in new_ticks])
-ax.set_title(title)
-ax.set_ylabel(hvos.mlabel(len(movie_request_time)))
-ax.set_xlabel('date')
-ax.xaxis.set_tick_params(labelsize=10)
-ax.grid(linestyle='dotted')
-fig.autofmt_xdate(rotation=65)
-plt.legend()
-plt.tight_layout()
+with hvtrace.stage('binning'):
+    h = hvroll.counts('jhv_movie_timestamps_only', 'Q', name='movies', directory=directory)
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+figures.append(hvrender.figure(hvrender.bars, os.path.join(img, filename),
+                               data={'counts': h.values},
+                               ticklabels=[dt.strftime('%Y-%m-%d') for dt in h.index.to_pydatetime()],
+                               label='movies',
+                               xlabel='date',
+                               ylabel=hvos.mlabel(len(movie_request_time)),
+                               title=title))
+
+# Daily numbers, drawn as a plot in figure 7 and as a distribution in figure 8
+with hvtrace.stage('binning'):
+    h = hvroll.counts('jhv_movie_timestamps_only', 'D', name='movies', directory=directory).to_frame()
+movies_per_day = np.asarray(list(h["movies"]))
+mean = int(np.rint(np.mean(movies_per_day)))
+median = int(np.rint(np.median(movies_per_day)))
+
+# Figure 8
+# Distribution of the number of movies made per day
+title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
+per_day_counts, per_day_edges = np.histogram(movies_per_day, bins=60)
+per_day_lines = [(mean, {'color': 'r', 'linestyle': 'dashed', 'label': 'mean ({{{:n}}})'.format(mean)}),
+                 (median, {'color': 'k', 'linestyle': 'dashed', 'label': 'median ({{{:n}}})'.format(median)})]
+filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
+filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
+figures.append(hvrender.figure(hvrender.histogram, os.path.join(img, filename),
+                               data={'counts': per_day_counts, 'edges': per_day_edges},
+                               label='movies',
+                               vlines=per_day_lines,
+                               xlabel='number of movies per day ({{{:s}}})'.format(hvos.quantity['jhvm']),
+                               ylabel='number of days\n[{{{:n}}} total]'.format(len(movies_per_day)),
+                               title='{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)),
+                               legend=True,
+                               framealpha=0.2))
+
+# Draw the figures above at the same time.  Figures that have not changed
+# since they were last drawn are skipped.
+hvrender.render(figures, group='jhv_movies_analyze_timestamps_only')
 
 # Figure 7
+figure = hvtrace.begin('figure 7')
 # Daily numbers as a plot
 title = '{:s} daily movies requested ({{{:s}}})'.format(application, hvos.quantity['jhvm'])
 plt.close('all')
 fig = plt.figure(figsize=figsize)
 ax = fig.add_subplot(111)
-h = df.groupby(pd.TimeGrouper(freq='D')).count()
-h.rename(columns={'date': 'movies'}, inplace=True)
 subtitle = '({{{:s}}} - {{{:s}}})'.format(str(h.index.min().to_pydatetime().date()), str(h.index.max().to_pydatetime().date()))
-movies_per_day = np.asarray(list(h["movies"]))
-mean = np.int(np.rint(np.mean(movies_per_day)))
-median = np.int(np.rint(np.median(movies_per_day)))
 h.plot(kind='line', ax=ax)
 ax.axhline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
 ax.axhline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
@@ -137,24 +153,5 @@ plt.tight_layout()
 filename = hvos.overleaf(os.path.join(data_type, title))
 filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
 filepath = os.path.join(img, filename)
-plt.savefig(filepath)
-
-
-# Figure 8
-# Distribution of the number of movies made per day
-title = 'distribution of number of {{{:s}}} per day'.format(data_analyzed)
-plt.close('all')
-plt.hist(movies_per_day, bins=60, label='movies')
-plt.axvline(mean, color='r', linestyle='dashed', label='mean ({{{:n}}})'.format(mean))
-plt.axvline(median, color='k', linestyle='dashed', label='median ({{{:n}}})'.format(median))
-plt.yscale('log')
-plt.xlabel('number of movies per day ({{{:s}}})'.format(hvos.quantity['jhvm']))
-plt.ylabel('number of days\n[{{{:n}}} total]'.format(len(movies_per_day)))
-plt.title('{{{:s}}}\n[{{{:n}}} total]'.format(title, np.sum(movies_per_day)))
-plt.grid('on', linestyle='dotted')
-plt.legend(framealpha=0.2)
-plt.tight_layout()
-filename = hvos.overleaf(os.path.join(data_type, 'histogram_number_of_movies_per_day'))
-filename = '{:s}.{:s}'.format(filename, hvos.imgfiletype)
-filepath = os.path.join(img, filename)
-plt.savefig(filepath)
+hvotex.savefig(filepath)
+figure.end()
@@ -3,140 +3,105 @@
 #
 
 import os
-import datetime
 import pickle
-import json
-import numpy as np
 import pandas as pd
-from sunpy.time import parse_time
+
+import hvorg_time as hvot
+import hvorg_sources as hvsrc
+import hvorg_catalog as hvcat
+import hvorg_stream as hvstream
+import hvorg_derived as hvod
+import hvorg_trace as hvtrace
 
 # The sources ids
 get_sources_ids = 'getDataSources.json'
 
 # Save the data
-save_directory = os.path.expanduser('~/Data/hvanalysis/derived')
+save_directory = hvod.directory
+
+# How to prepare the data.  'full' reads the log into memory in one go,
+# 'streaming' reads it chunksize rows at a time so that memory use stays
+# flat however large the log is.  'incremental' streams only the rows added
+# since the last streaming or incremental run, and appends them to the
+# derived data.  A full run removes the watermark, so the next incremental
+# run prepares the whole log again rather than appending to the outputs of
+# the full run.
+# The pipeline passes its own settings in to the script, and these take the
+# place of the defaults here.
+prepare_mode = globals().get('prepare_mode', 'full')
+# prepare_mode = 'streaming'
+# prepare_mode = 'incremental'
+chunksize = globals().get('chunksize', hvstream.chunksize)
+
+# Number of worker processes used to parse the times
+workers = globals().get('workers', hvstream.workers)
 
 # Read in the data
 directory = os.path.expanduser('~/Data/hvanalysis/source')
 jhv_movies = 'jpx.csv'
 path = os.path.expanduser(os.path.join(directory, jhv_movies))
-df = pd.read_csv(path)
 
 data_type = 'Jhelioviewer movies'
 
-# Get some figures of merit for the movies
-# When was the movie requested?
-print('Parsing movie times')
-request_time = [parse_time(x) for x in df.timestamp.tolist()]
-
-# What was the movie start time?
-movie_start_time = [parse_time(x) for x in df.StartDate.tolist()]
-
-# What was the movie end time?
-movie_end_time = [parse_time(x) for x in df.EndDate.tolist()]
-
-# How many movies in the CSV file?
-nmovies = len(request_time)
-
-# How much time did the movie cover?
-movie_durations = np.asarray([(movie_end_time[i] - movie_start_time[i]).total_seconds() for i in range(0, nmovies)])
-
-# What was the mid point of the movie?
-movie_mid_point = [movie_start_time[i] + datetime.timedelta(seconds=0.5*movie_durations[i]) for i in range(0, nmovies)]
-
-# Calculate the time difference between the time of the request and the
-# movie time.  The start time is used since this is the only one that
-# can
-time_difference = np.asarray([(request_time[i] - movie_start_time[i]).total_seconds() for i in range(0, nmovies)])
-
-# Save the time information
-print('Saving movie time information')
-f = os.path.join(save_directory, 'jhv_movie_durations_seconds.npy')
-np.save(f, movie_durations)
-
-f = os.path.join(save_directory, 'jhv_movie_mid_point_seconds.npy')
-np.save(f, movie_mid_point)
-
-f = os.path.join(save_directory, 'jhv_movie_time_difference_seconds.npy')
-np.save(f, time_difference)
-
-f = os.path.join(save_directory, 'jhv_movie_request_time.pkl')
-pickle.dump(request_time, open(f, 'wb'))
-
-f = os.path.join(save_directory, 'jhv_movie_start_time.pkl')
-pickle.dump(movie_start_time, open(f, 'wb'))
-
-f = os.path.join(save_directory, 'jhv_movie_end_time.pkl')
-pickle.dump(movie_end_time, open(f, 'wb'))
-
-
-# Analyze the sourceID column.  Split it up, find the unique elements,
-# and create a data frame.
-all_sources = []
-for source_id in df.DataSourceID.tolist():
-    ids = str(source_id).split(',')
-    for id in ids:
-        if id not in all_sources:
-            all_sources.append(id)
-
-
-def extract_data_source_names(a, removal_type='all'):
-    if removal_type == 'all':
-        b = a.replace(" ", "")
-        b = b.split(',')
-    if removal_type == 'lr':
-        b = a.strip()
-        b = b.split(' , ')
-    return b
-
-all_data_source_names = []
-for i, data_source_names in enumerate(df.DataSourceNames.tolist()):
-    if isinstance(data_source_names, str):
-        dsns = extract_data_source_names(data_source_names, removal_type='lr')
-        for dsn in dsns:
-            if dsn not in all_data_source_names:
-                all_data_source_names.append(dsn)
-
 # Analyze the Helioviewer getsourcesid return - map the sourceIds to the nicknames
-f = os.path.expanduser(os.path.join(directory, get_sources_ids))
-j = json.load(open(f, 'r'))
-
-
-def id_generator(dict_var):
-    for k, v in dict_var.items():
-        if k == "sourceId":
-            yield dict_var["sourceId"], dict_var["nickname"]
-        elif isinstance(v, dict):
-            for id_val in id_generator(v):
-                yield id_val
-
-source_ids_and_nicknames = list(id_generator(j))
+catalog = hvcat.load(os.path.expanduser(os.path.join(directory, get_sources_ids)))
+source_ids_and_nicknames = catalog.source_ids_and_nicknames()
 #f = os.path.join(save_directory, 'hvorg_sourceids_and_nicknames.pkl')
 #pickle.dump(source_ids_and_nicknames, open(f, 'wb'))
 
-# Create a new dataframe that explicitly holds which data source was used in each movie
-print('Create a new dataframe that explicitly holds which data source was used in each movie')
-df_new = pd.DataFrame(0, index=df.index, columns=all_sources)
-df_new.index.name = 'movie number'
-for this_index in df.index:
-    source_id = df.loc[this_index, "DataSourceID"]
-    ids = str(source_id).split(',')
-    for id in ids:
-        df_new.loc[this_index, id] = 1
-
-# Change the column names to the easier to understand source nicknames
-df_new_column_names = list(df_new.columns.values)
-for df_new_column_name in df_new_column_names:
-    for source_id_and_nickname in source_ids_and_nicknames:
-        this_source_id = source_id_and_nickname[0]
-        this_nickname = source_id_and_nickname[1]
-        if df_new_column_name == str(this_source_id):
-            df_new.rename(columns={df_new_column_name: this_nickname}, inplace=True)
-
-
-# Save the source ID information
-f = os.path.join(save_directory, 'jhv_data_source_ids.csv')
-df_new.to_csv(f)
+
+if prepare_mode in ('streaming', 'incremental'):
+    print('Parsing movie times and data sources')
+    all_sources, all_data_source_names = hvstream.prepare_movies([path], save_directory, 'jhv',
+                                                                 catalog, chunksize=chunksize,
+                                                                 incremental=prepare_mode == 'incremental',
+                                                                 workers=workers)
+else:
+    hvstream.remove_watermark(save_directory, 'jhv_movie')
+
+    with hvtrace.stage('read logs') as stage:
+        df = pd.read_csv(path)
+        stage.count(len(df))
+
+    # Get some figures of merit for the movies - when was the movie requested,
+    # what were the movie start and end times, how much time did the movie
+    # cover, what was its mid point, and what was the time difference between
+    # the time of the request and the movie start and end times?
+    print('Parsing movie times')
+    times = hvstream.derive_frame(hvot.movie_times, df, workers=workers, chunksize=chunksize)
+
+    # Save the time information
+    print('Saving movie time information')
+    with hvtrace.stage('save times'):
+        for key, value in times.items():
+            hvod.save('jhv_movie_{:s}'.format(key), value, directory=save_directory)
+
+    # Dictionary encode the sources and the names of the sources used in each
+    # movie.  The unique names come from the unique combinations of names.
+    with hvtrace.stage('encode sources', rows=len(df)):
+        source_codes, source_dictionary = hvsrc.encode(df.DataSourceID)
+        hvsrc.save_encoded(save_directory, 'jhv_data_source_ids', source_codes, source_dictionary)
+
+        name_codes, name_dictionary = hvsrc.encode(df.DataSourceNames)
+        hvsrc.save_encoded(save_directory, 'jhv_data_source_names', name_codes, name_dictionary)
+        all_data_source_names = hvsrc.unique_tokens(name_dictionary, sep=' , ')
+
+    # Analyze the sourceID column.  Split up its unique combinations, find the
+    # unique elements, and record which data source was used in each movie.
+    print('Recording which data source was used in each movie')
+    with hvtrace.stage('incidence matrix', rows=len(df)):
+        source_incidence, all_sources = hvsrc.encoded_incidence(source_codes, source_dictionary)
+
+    # Change the column names to the easier to understand source nicknames
+    source_nicknames = catalog.nicknames(all_sources)
+
+    # Save the source ID information
+    with hvtrace.stage('save incidence', rows=len(df)):
+        f = os.path.join(save_directory, 'jhv_data_source_ids.csv')
+        hvsrc.write_incidence_csv(source_incidence, source_nicknames, f, index=df.index)
+
+        f = os.path.join(save_directory, 'jhv_data_source_ids.npz')
+        hvsrc.save_incidence(f, source_incidence)
 
 # Save the data source names
 f = os.path.join(save_directory, 'jhv_data_source_names.pkl')
@@ -3,27 +3,35 @@
 #
 
 import os
-import pickle
 import pandas as pd
-from sunpy.time import parse_time
+
+import hvorg_time as hvot
+import hvorg_derived as hvod
+import hvorg_stream as hvstream
+import hvorg_trace as hvtrace
 
 
 # Save the data
-save_directory = os.path.expanduser('~/Data/hvanalysis/derived')
+save_directory = hvod.directory
+
+# Number of worker processes used to parse the times, unless the pipeline
+# passes in its own
+workers = globals().get('workers', hvstream.workers)
 
 # Read in the data
 directory = os.path.expanduser('~/Data/hvanalysis/source')
 jhv_movies = 'jhv_request_statistics.csv'
 path = os.path.expanduser(os.path.join(directory, jhv_movies))
-df = pd.read_csv(path)
+with hvtrace.stage('read logs') as stage:
+    df = pd.read_csv(path)
+    stage.count(len(df))
 
 data_type = 'Jhelioviewer movies'
 
 # Get some figures of merit for the movies
 # When was the movie requested?
 print('Parsing movie times')
-request_time = [parse_time(x) for x in df.timestamp.tolist()]
+request_time = hvstream.derive_frame(hvot.request_times, df, workers=workers)['request_time']
 
 # Save the time information
-f = os.path.join(save_directory, 'jhv_movie_request_timestamps_only.pkl')
-pickle.dump(request_time, open(f, 'wb'))
+hvod.save('jhv_movie_request_timestamps_only', request_time, directory=save_directory)